@@ -0,0 +1,53 @@
+# Measure the import of a large CSV file with req:req :csv-file:
+#
+# python benchmarks/bench_csv.py --rows 10000,50000,150000 [--filter 'priority==1'] [--sort=-priority]
+#
+# With a selective filter, the peak memory should depend on the number of
+# imported requirements, not on the size of the CSV file.
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(__file__))
+import corpus
+
+# run the build and report the peak memory of the process
+BUILD = '''
+import sys, resource
+from sphinx.cmd.build import main
+ret = main(sys.argv[1:])
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+sys.exit(ret)
+'''
+
+#______________________________________________________________________________
+def build(srcdir, outdir, builder):
+    start = time.perf_counter()
+    p = subprocess.run([sys.executable, '-c', BUILD, '-q', '-E', '-b', builder,
+                        '-d', os.path.join(outdir, '.doctrees'), srcdir, outdir],
+                       check=True, stdout=subprocess.PIPE, text=True)
+    return time.perf_counter() - start, int(p.stdout.split()[-1]) / 1024
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Import time and memory as a function of the CSV size')
+    parser.add_argument("-r", "--rows", default='10000,50000,150000', help="Comma separated list of row counts")
+    parser.add_argument("-f", "--filter", default='priority==1', help="Filter applied on the import")
+    parser.add_argument("-s", "--sort", default=None, help="Sort applied on the import")
+    parser.add_argument("-b", "--builder", default='html', help="Sphinx builder")
+    args = parser.parse_args(argv)
+
+    print('%10s %10s %10s %14s' % ('rows', 'size (MB)', 'time (s)', 'peak RSS (MB)'))
+    for n in [int(x) for x in args.rows.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            srcdir = os.path.join(tmp, 'src')
+            corpus.make_csv_project(srcdir, n, filter=args.filter, sort=args.sort)
+            size = os.path.getsize(os.path.join(srcdir, 'reqs.csv')) / 1024 / 1024
+            t, rss = build(srcdir, os.path.join(tmp, 'out'), args.builder)
+        print('%10d %10.1f %10.2f %14.1f' % (n, size, t, rss))
+
+if __name__ == '__main__':
+    main()
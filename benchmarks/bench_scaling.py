@@ -0,0 +1,41 @@
+# Measure how a full build scales with the number of requirements
+#
+# python benchmarks/bench_scaling.py --sizes 1000,5000,10000,50000 [-b html]
+#
+# The time per requirement should stay roughly constant when the number of
+# requirements grows.
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(__file__))
+import corpus
+
+#______________________________________________________________________________
+def build(srcdir, outdir, builder):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'sphinx.cmd.build', '-q', '-E', '-b', builder,
+                    '-d', os.path.join(outdir, '.doctrees'), srcdir, outdir], check=True)
+    return time.perf_counter() - start
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Build time as a function of the number of requirements')
+    parser.add_argument("-s", "--sizes", default='1000,5000,10000,50000', help="Comma separated list of requirement counts")
+    parser.add_argument("-b", "--builder", default='html', help="Sphinx builder")
+    parser.add_argument("-p", "--per-doc", default=100, dest='per_doc', type=int, help="Number of requirements per document")
+    args = parser.parse_args(argv)
+
+    print('%10s %10s %12s' % ('reqs', 'time (s)', 'ms per req'))
+    for n in [int(x) for x in args.sizes.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            srcdir = os.path.join(tmp, 'src')
+            corpus.make_project(srcdir, n, reqs_per_doc=args.per_doc)
+            t = build(srcdir, os.path.join(tmp, 'out'), args.builder)
+        print('%10d %10.2f %12.3f' % (n, t, 1000 * t / n))
+
+if __name__ == '__main__':
+    main()
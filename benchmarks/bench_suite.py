@@ -0,0 +1,172 @@
+# Full and incremental builds of a synthetic project, with the time and the
+# peak memory of each build and the time (and with --memory the peak memory) of
+# each phase of the extension (req_profile)
+#
+# python benchmarks/bench_suite.py --reqs 5000 --links 2 --reqlists 10 --filter 'priority > 50' \
+#     --csv-rows 10000 [-b html,latex] [-j 4] [-o results.json] [--compare previous.json]
+#
+# The builds of each builder are:
+#
+# - full: everything read and written (-E)
+# - noop: nothing changed
+# - touch: a paragraph added to a document, no requirement changed
+# - edit: the title of a requirement changed, the documents depending on it are written again
+#
+# With --memory, the builds trace the memory allocations (tracemalloc) and report
+# the peak memory of each phase: tracing slows the builds down, compare only the
+# times of runs with the same option.
+#
+# The results (and the parameters) can be saved with -o and compared with a
+# previous run with --compare: compare only results of the same parameters.
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(__file__))
+import corpus
+
+# run the build and report the peak memory of the process (and its children when using -j)
+BUILD = '''
+import sys, resource, tracemalloc
+if sys.argv.pop(1) == 'memory':
+    tracemalloc.start()
+from sphinx.cmd.build import main
+ret = main(sys.argv[1:])
+print(max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+          resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))
+sys.exit(ret)
+'''
+
+STEPS = ('full', 'noop', 'touch', 'edit')
+
+#______________________________________________________________________________
+def build(srcdir, outdir, builder, fresh=False, jobs=1, memory=False):
+    args = ['-q', '-b', builder, '-d', os.path.join(outdir, '.doctrees'), '-D', 'req_profile=1']
+    if fresh:
+        args.append('-E')
+    if jobs > 1:
+        args += ['-j', str(jobs)]
+    start = time.perf_counter()
+    p = subprocess.run([sys.executable, '-c', BUILD, 'memory' if memory else '-'] + args + [srcdir, outdir],
+                       check=True, stdout=subprocess.PIPE, text=True)
+    t = time.perf_counter() - start
+    with open(os.path.join(outdir, 'req-profile.json')) as f:
+        profile = json.load(f)
+    return {
+        'time': round(t, 3),
+        'rss': round(int(p.stdout.split()[-1]) / 1024, 1),
+        'phases': { phase: entry['time'] for phase, entry in profile['phases'].items() },
+        'peaks': { phase: round(entry['peak'] / 2**20, 1)
+                   for phase, entry in profile['phases'].items() if 'peak' in entry },
+        'counters': profile['counters'],
+    }
+
+def modify(srcdir, docname, step):
+    if step not in ('touch', 'edit'):
+        return
+    fn = os.path.join(srcdir, docname + '.rst')
+    with open(fn) as f:
+        s = f.read()
+    if step == 'touch':
+        s += '\nA new paragraph.\n'
+    elif step == 'edit':
+        s = s.replace('.. req:req:: Requirement number', '.. req:req:: Changed requirement number', 1)
+    with open(fn, 'w') as f:
+        f.write(s)
+
+def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        srcdir = os.path.join(tmp, 'src')
+        docnames = corpus.make_project(srcdir, args.reqs, reqs_per_doc=args.per_doc, links=args.links,
+                                       reqlists=args.reqlists, filter=args.filter, csv_rows=args.csv_rows)
+        # a document in the middle, with some requirements
+        docname = docnames[(args.reqs + args.per_doc - 1) // args.per_doc // 2]
+        for builder in args.builders.split(','):
+            outdir = os.path.join(tmp, builder)
+            for step in STEPS:
+                modify(srcdir, docname, step)
+                r = build(srcdir, outdir, builder, fresh=(step=='full'), jobs=args.jobs, memory=args.memory)
+                r.update(builder=builder, step=step)
+                results.append(r)
+                print_result(r)
+    return results
+
+#______________________________________________________________________________
+def print_result(r):
+    phases = sorted(r['phases'].items(), key=lambda x: -x[1])[:4]
+    print('%-8s %-6s %9.2f %10.1f %6d %6d   %s' % (r['builder'], r['step'], r['time'], r['rss'],
+        r['counters']['documents_read'], r['counters']['documents_processed'],
+        ', '.join('%s %.2f' % x for x in phases)))
+    if r['peaks']:
+        peaks = sorted(r['peaks'].items(), key=lambda x: -x[1])[:4]
+        print('%-47s   peak (MB): %s' % ('', ', '.join('%s %.1f' % x for x in peaks)))
+    sys.stdout.flush()
+
+def compare(results, previous):
+    before = { (r['builder'], r['step']): r for r in previous['results'] }
+    print()
+    print('%-8s %-6s %9s %9s %7s %10s %10s %7s' % ('builder', 'step', 'before', 'time', 'ratio',
+        'before', 'RSS', 'ratio'))
+    for r in results:
+        b = before.get((r['builder'], r['step']))
+        if b is None:
+            continue
+        print('%-8s %-6s %9.2f %9.2f %7.2f %10.1f %10.1f %7.2f' % (r['builder'], r['step'],
+            b['time'], r['time'], r['time'] / b['time'], b['rss'], r['rss'], r['rss'] / b['rss']))
+
+def version():
+    # the version of the extension (commit if in a git repository)
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(__file__),
+                              check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Full and incremental builds of a synthetic project')
+    parser.add_argument("-r", "--reqs", default=5000, type=int, help="Number of requirements")
+    parser.add_argument("-p", "--per-doc", default=100, dest='per_doc', type=int, help="Number of requirements per document")
+    parser.add_argument("-l", "--links", default=1, type=int, help="Number of parents of each requirement")
+    parser.add_argument("-n", "--reqlists", default=0, type=int, help="Number of req:reqlist")
+    parser.add_argument("-f", "--filter", default=None, help="Filter of the req:reqlist")
+    parser.add_argument("-c", "--csv-rows", default=0, dest='csv_rows', type=int, help="Number of requirements imported from a CSV file")
+    parser.add_argument("-b", "--builders", default='html,latex', help="Comma separated list of Sphinx builders")
+    parser.add_argument("-j", "--jobs", default=1, type=int, help="Number of processes of each build")
+    parser.add_argument("-m", "--memory", action='store_true', help="Peak memory of each phase (slower builds)")
+    parser.add_argument("-o", "--output", default=None, help="Save the results in a JSON file")
+    parser.add_argument("--compare", default=None, help="Compare with the results saved by a previous run")
+    args = parser.parse_args(argv)
+
+    import sphinx
+    print('%-8s %-6s %9s %10s %6s %6s   %s' % ('builder', 'step', 'time (s)', 'RSS (MB)', 'read', 'proc.',
+        'slowest phases (s)'))
+    sys.stdout.flush()
+    results = run(args)
+    report = {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'version': version(),
+        'python': platform.python_version(),
+        'sphinx': sphinx.__version__,
+        'parameters': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if previous['parameters'] != report['parameters']:
+            print('Warning: different parameters in %s' % args.compare)
+        compare(results, previous)
+
+if __name__ == '__main__':
+    main()
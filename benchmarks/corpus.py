@@ -0,0 +1,113 @@
+# Generation of synthetic Sphinx projects used by the benchmarks
+#
+# The generated requirements are spread over several documents, with links
+# between them (parents/children) and references using :req:req:
+
+import os
+import csv
+import random
+
+CONF = '''
+project = 'benchmark'
+master_doc = 'index'
+extensions = ['sphinxcontrib.requirement']
+
+req_links = {
+    "parents":"children",
+}
+'''
+
+#______________________________________________________________________________
+def reqid(i):
+    return 'REQ-%06d' % i
+
+def make_project(root, nreqs, reqs_per_doc=100, seed=0, links=1, reqlists=0, filter=None, csv_rows=0):
+    """
+    Write in root a Sphinx project defining nreqs requirements
+
+    links: number of parents of each requirement (the density of req_links)
+    reqlists: number of req:reqlist in the document "lists", using filter
+    csv_rows: number of requirements imported from a CSV file in the document "imported"
+    """
+    rnd = random.Random(seed)
+    # the options are drawn separately, the project is the same as before without them
+    options = reqlists or csv_rows
+    rnd_options = random.Random(seed + 1)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'conf.py'), 'w') as f:
+        f.write(CONF)
+        if options:
+            f.write('req_options = dict(priority="directives.positive_int")\n')
+
+    ndocs = (nreqs + reqs_per_doc - 1) // reqs_per_doc
+    docnames = ['doc%05d' % d for d in range(ndocs)]
+    if reqlists:
+        docnames.append('lists')
+    if csv_rows:
+        docnames.append('imported')
+    with open(os.path.join(root, 'index.rst'), 'w') as f:
+        f.write('Benchmark\n=========\n\n.. toctree::\n\n')
+        for docname in docnames:
+            f.write('    %s\n' % docname)
+
+    for d in range(ndocs):
+        with open(os.path.join(root, docnames[d] + '.rst'), 'w') as f:
+            f.write('Document %d\n%s\n\n' % (d, '=' * 20))
+            for i in range(d * reqs_per_doc, min(nreqs, (d + 1) * reqs_per_doc)):
+                f.write('.. req:req:: Requirement number %d\n' % i)
+                f.write('    :reqid: %s\n' % reqid(i))
+                if i > 0 and links:
+                    parents = [reqid(rnd.randrange(i))]
+                    parents += [reqid(rnd_options.randrange(i)) for k in range(links - 1)]
+                    f.write('    :parents: %s\n' % ', '.join(sorted(set(parents))))
+                if options:
+                    f.write('    :priority: %d\n' % rnd_options.randint(1, 100))
+                f.write('\n    Content of the requirement %d, with *some* markup.\n\n' % i)
+                f.write('See :req:req:`%s`\n\n' % reqid(rnd.randrange(nreqs)))
+
+    if reqlists:
+        with open(os.path.join(root, 'lists.rst'), 'w') as f:
+            f.write('Lists\n=====\n\n')
+            for k in range(reqlists):
+                f.write('.. req:reqlist:: List %d\n' % k)
+                if filter:
+                    f.write('    :filter: %s\n' % filter)
+                # a different sort for each list: the queries are not shared
+                f.write('    :sort: %spriority\n' % ('-' if k % 2 else ''))
+                f.write('    :fields: reqid, title, priority, parents\n')
+                f.write('    :widths: 20 50 10 20\n\n')
+
+    if csv_rows:
+        _write_csv(os.path.join(root, 'reqs.csv'), nrows=csv_rows, rnd=rnd_options, first=nreqs)
+        with open(os.path.join(root, 'imported.rst'), 'w') as f:
+            f.write('Imported\n========\n\n.. req:req::\n    :csv-file: reqs.csv\n')
+    return docnames
+
+def _write_csv(path, nrows, rnd, first=0):
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['reqid', 'title', 'content', 'priority'])
+        for i in range(first, first + nrows):
+            w.writerow([reqid(i), 'Imported requirement %d' % i,
+                        'Content of the requirement %d.\n\nWith a second paragraph and *some* markup.' % i,
+                        rnd.randint(1, 100)])
+
+#______________________________________________________________________________
+def make_csv_project(root, nrows, filter=None, sort=None, seed=0):
+    """
+    Write in root a Sphinx project importing a CSV file of nrows requirements
+    """
+    rnd = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'conf.py'), 'w') as f:
+        f.write(CONF)
+        f.write('req_options = dict(priority="directives.positive_int")\n')
+
+    _write_csv(os.path.join(root, 'reqs.csv'), nrows, rnd)
+
+    with open(os.path.join(root, 'index.rst'), 'w') as f:
+        f.write('Benchmark\n=========\n\n.. req:req::\n    :csv-file: reqs.csv\n')
+        if filter:
+            f.write('    :filter: %s\n' % filter)
+        if sort:
+            f.write('    :sort: %s\n' % sort)
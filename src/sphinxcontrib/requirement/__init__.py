@@ -1,8 +1,7 @@
 
-from . import req
-
 __version__ = "1.5+snapshot"
 
 def setup(app):
+    # imported here: the command line tools (__main__, lint) do not need Sphinx
+    from . import req
     return req.setup(app)
-
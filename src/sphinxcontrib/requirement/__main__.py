@@ -3,32 +3,61 @@
 # Example:
 #   python -m sphinxcontrib.requirement -i doc/requirement1.rst -o doc/requirement1.rst.new --doc AA --start-serial 900
 #    diff -w doc/requirement1.rst doc/requirement1.rst.new
+#
+# python -m sphinxcontrib.requirement --dir <directory> [--check] [-j <int>] [--doc <str>] [--start-serial <int>]
+#   Assign an ID to the requirements of all the ReST files of a directory (recursively), in place.
+#   Without --doc, the document ID is the index of the file (in the sorted list of files).
+#   The generated IDs never collide with an existing reqid or label (including the CSV imports):
+#   a serial already used is skipped.
+#   With --check, nothing is written and the exit code is 1 if some requirements have no ID.
+# Example:
+#   python -m sphinxcontrib.requirement --dir doc -p 'REQ-{doc:02}{serial:03d}' --check
 
+import os
 import sys
+import csv
+import fnmatch
 import logging
 import argparse
+import tempfile
+import importlib
 import re
+from concurrent.futures import ProcessPoolExecutor
+
+rReq = re.compile(r'(?P<req>\.\. req:req::.*)\n(?P<options>(    :(?P<optionkey>[\w-]+):(?P<optionvalue>.*)\n)+)', re.UNICODE)
+rOption = re.compile(r'    :(?P<optionkey>[\w-]+):(?P<optionvalue>.*)\n', re.UNICODE)
 
-rReq = re.compile(r'(?P<req>.. req:req::.*)\n(?P<options>(    :(?P<optionkey>\w+):(?P<optionvalue>.*)\n)+)', re.UNICODE)
-rOption = re.compile(r'    :(?P<optionkey>\w+):(?P<optionvalue>.*)\n', re.UNICODE)
+# the globals of the filters (:filter: of req:req and req:reqlist), in req.py and lint.py
+FILTER_GLOBALS = {name: importlib.import_module(name) for name in
+                  ('io', 'os', 'csv', 'json', 'pickle', 'hashlib', 'functools', 'contextlib', 'time', 'textwrap', 're')}
 
 # _____________________________________________________________________________
+def has_id(mo_req):
+    # True if the requirement has an ID or is an import (no ID needed)
+    for mo_opt in rOption.finditer(mo_req['options']):
+        logging.debug(mo_opt['optionkey'] + '/' + mo_opt['optionvalue'])
+        if mo_opt['optionkey'] == 'reqid' or mo_opt['optionkey'] == 'csv-file':
+            return True
+    return False
+
+def assign(buf, new_id, newline='\n'):
+    # Add the option reqid to all the requirements without ID, new_id() giving the IDs
+    def fReq(mo_req):
+        if not has_id(mo_req):
+            logging.info('Found one requirement with no ID: [{}]'.format(mo_req['req'][12:].strip()))
+            return mo_req['req']+'\n    :reqid: '+new_id()+newline+mo_req['options']
+        return mo_req['req']+'\n'+mo_req['options']
+    return rReq.sub(fReq, buf)
+
 def process(args):
     serial = args.start_serial
     buf = args.input.read()
-    def fReq(mo_req, ctx=locals()):
-        serial = ctx['serial']
-        for mo_opt in rOption.finditer(mo_req['options']):
-            logging.debug(mo_opt['optionkey'] + '/' + mo_opt['optionvalue'])
-            if mo_opt['optionkey'] == 'reqid' or mo_opt['optionkey'] == 'csv-file':
-                break
-        else:
-            logging.info('Found one requirement with no ID: [{}]'.format(mo_req['req'][12:].strip()))
-            nreqid = args.req_idpattern.format(**dict(doc=args.doc, serial=serial))
-            ctx['serial'] = serial + 1
-            return mo_req['req']+'\n    :reqid: '+nreqid+'\n'+mo_req['options']
-        return mo_req['req']+'\n'+mo_req['options']
-    buf = rReq.sub(fReq, buf)
+    def new_id():
+        nonlocal serial
+        nreqid = args.req_idpattern.format(**dict(doc=args.doc, serial=serial))
+        serial = serial + 1
+        return nreqid
+    buf = assign(buf, new_id)
 
     if args.output == '-':
         sys.stdout.write(buf)
@@ -40,6 +69,124 @@ def process(args):
         with open(args.output, 'w', encoding='utf-8') as f:
             f.write(buf)
 
+# _____________________________________________________________________________
+def find_files(directory, suffix='.rst', exclude=()):
+    # the ReST files of a directory, sorted
+    files = []
+    for root, dirs, filenames in os.walk(directory):
+        dirs[:] = [d for d in dirs if not d.startswith('.') and not any(fnmatch.fnmatch(d, x) for x in exclude)]
+        for fn in filenames:
+            if fn.endswith(suffix):
+                files.append(os.path.relpath(os.path.join(root, fn), directory))
+    files.sort()
+    return files
+
+def csv_path(path, filename, root=None):
+    # the CSV file imported by a ReST file: relative to this file, or to the
+    # source directory (root) if it starts with /, as Sphinx
+    if filename.startswith('/') and root is not None:
+        return os.path.join(root, filename.lstrip('/'))
+    return os.path.join(os.path.dirname(path), filename)
+
+def scan_csv(path):
+    # the IDs and labels of the rows of a CSV file (all of them, filtered or not)
+    ids = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for row in csv.DictReader(f, delimiter=','):
+                ids.extend(row[k].strip() for k in ('reqid', 'label') if row.get(k, '').strip())
+    except OSError:
+        pass
+    return ids
+
+def scan(path, root=None):
+    # the IDs and labels defined in a file (including the CSV files imported)
+    # and the number of requirements without ID
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = f.read()
+    ids = []
+    missing = 0
+    for mo_req in rReq.finditer(buf):
+        if not has_id(mo_req):
+            missing += 1
+        for mo_opt in rOption.finditer(mo_req['options']):
+            if mo_opt['optionkey'] in ('reqid', 'label'):
+                ids.append(mo_opt['optionvalue'].strip())
+            elif mo_opt['optionkey'] == 'csv-file':
+                ids.extend(scan_csv(csv_path(path, mo_opt['optionvalue'].strip(), root)))
+    return ids, missing
+
+def rewrite(path, new_ids):
+    # assign the IDs to the requirements without ID and replace the file at once
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        buf = f.read()
+    new_ids = iter(new_ids)
+    # the lines added end as the other lines of the file
+    buf = assign(buf, lambda: next(new_ids), '\r\n' if '\r\n' in buf else '\n')
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.write(buf)
+        os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+def allocate(files, scanned, pattern, doc=None, start_serial=1):
+    # The new IDs of each file (in the order of the files): for each document ID,
+    # the serials are given in sequence, skipping the IDs already used
+    used = set()
+    for ids, missing in scanned:
+        used.update(ids)
+    next_serial = {}
+    new_ids = {}
+    for index, (fn, (ids, missing)) in enumerate(zip(files, scanned)):
+        if not missing:
+            continue
+        d = index if doc is None else doc
+        serial = next_serial.get(d, start_serial)
+        new_ids[fn] = []
+        while len(new_ids[fn]) < missing:
+            nreqid = pattern.format(**dict(doc=d, serial=serial))
+            serial += 1
+            if nreqid not in used:
+                used.add(nreqid)
+                new_ids[fn].append(nreqid)
+        next_serial[d] = serial
+    return new_ids
+
+def process_dir(args):
+    files = find_files(args.dir, args.suffix, args.exclude)
+    paths = [os.path.join(args.dir, fn) for fn in files]
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        scanned = list(executor.map(scan, paths, [args.dir] * len(paths), chunksize=16))
+
+        # existing duplicates (not fixed here)
+        seen = {}
+        for fn, (ids, missing) in zip(files, scanned):
+            for x in ids:
+                if x in seen:
+                    logging.warning('{} defined in {} and {}'.format(x, seen[x], fn))
+                else:
+                    seen[x] = fn
+
+        new_ids = allocate(files, scanned, args.req_idpattern, args.doc, args.start_serial)
+        count = sum(len(x) for x in new_ids.values())
+        if args.check:
+            for fn, ids in new_ids.items():
+                logging.info('{}: {} requirement(s) without ID'.format(fn, len(ids)))
+            logging.info('{} requirement(s) without ID in {} file(s)'.format(count, len(new_ids)))
+            return 1 if count else 0
+
+        changed = list(new_ids)
+        for path in executor.map(rewrite, [os.path.join(args.dir, fn) for fn in changed],
+                                 [new_ids[fn] for fn in changed]):
+            logging.info('{} rewritten'.format(path))
+        logging.info('{} ID(s) assigned in {} file(s)'.format(count, len(changed)))
+    return 0
+
 # _____________________________________________________________________________
 def main(argv=sys.argv[1:]):
 
@@ -47,13 +194,21 @@ def main(argv=sys.argv[1:]):
     parser.add_argument("-i", "--input", dest='input', type=argparse.FileType('rt', encoding='utf-8'), help="Input file")
     parser.add_argument("-o", "--output", dest='output', default='-', type=str, help="Output file")
     parser.add_argument("-s", "--start-serial", default=1, dest='start_serial', type=int, help="First value of the serial number")
-    parser.add_argument("-d", "--doc", default='0', dest='doc', type=str, help="Document ID")
+    parser.add_argument("-d", "--doc", default=None, dest='doc', type=str, help="Document ID (default: 0, or the index of the file with --dir)")
     parser.add_argument("-p", "--req_idpattern", default='REQ-{doc}{serial:03d}', dest='req_idpattern', type=str, help="Requirement ID pattern")
 
+    parser.add_argument("--dir", default=None, dest='dir', help="Process all the ReST files of a directory, in place")
+    parser.add_argument("--suffix", default='.rst', dest='suffix', help="Suffix of the ReST files (with --dir)")
+    parser.add_argument("-x", "--exclude", default=None, dest='exclude', action='append', help="Directories excluded (with --dir, default: _build)")
+    parser.add_argument("-j", "--jobs", default=None, dest='jobs', type=int, help="Number of processes (with --dir, default: number of CPUs)")
+    parser.add_argument("--check", default=False, dest='check', action='store_true', help="Only report the requirements without ID (with --dir)")
+
     parser.add_argument("-l", "--loglevel", default='INFO', dest='loglevel', help="Log level")
     parser.add_argument("-f", "--logfile", default=None, dest='logfile', help="Log file")
 
     args = parser.parse_args(argv)
+    if args.exclude is None:
+        args.exclude = ['_build']
 
     h = logging.StreamHandler(sys.stdout)
     f = logging.Formatter('%(asctime)-15s %(levelname)s - %(message)s')
@@ -68,13 +223,24 @@ def main(argv=sys.argv[1:]):
         fh.setFormatter(f)
         logging.getLogger().addHandler(fh)
 
+    if args.dir:
+        logging.info('Starting')
+        ret = process_dir(args)
+        logging.info('Done')
+        return ret
+
+    if args.input is None:
+        logging.error('You must specify an input file or a directory')
+        return
     if args.input.name == args.output:
         logging.error('You must specify different input/output files')
         return
+    if args.doc is None:
+        args.doc = '0'
 
     logging.info('Starting')
     process(args)
     logging.info('Done')
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
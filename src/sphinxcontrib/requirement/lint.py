@@ -0,0 +1,347 @@
+
+# python -m sphinxcontrib.requirement.lint [<directory>] [--conf <conf.py>] [--links parents:children]
+#
+# Check the requirements of the ReST files of a directory without building them
+# (no Sphinx, no docutils parsing: the directives are found as in __main__):
+#
+# - reqid and label defined several times
+# - links (req_links) to an unknown requirement
+# - :req:req: and :req:ref: roles to an unknown requirement
+# - cycles in the links
+#
+# The requirements imported from a CSV file (:csv-file:) are included. req_links
+# and req_options are read from conf.py (without executing it).
+# Each problem is reported as <file>:<line>: <message>, the exit code is 1 if there are some.
+# Example:
+#   python -m sphinxcontrib.requirement.lint doc
+
+import os
+import re
+import ast
+import sys
+import csv
+import bisect
+import builtins
+import argparse
+
+from .__main__ import rReq, find_files, csv_path, FILTER_GLOBALS
+
+rRole = re.compile(r':req:(?P<role>req|ref):`(?P<target>[^`]*)`')
+# the start of a literal block (a paragraph ending with ::), or of the content of
+# a directive not parsed (code, req:reqlist: a template)
+rLiteralEnd = re.compile(r'::[ \t]*$', re.MULTILINE)
+rLiteralDirective = re.compile(r'\.\. (?:code-block|code|sourcecode|req:reqlist)::.*$', re.MULTILINE)
+rInlineLiteral = re.compile(r'``.*?``')
+
+# _____________________________________________________________________________
+def read_conf(path):
+    # req_links and req_options of a conf.py, when defined with literals
+    conf = {}
+    if not path or not os.path.isfile(path):
+        return conf
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    for stmt in tree.body:
+        if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.targets[0], ast.Name):
+            name = stmt.targets[0].id
+            if name in ('req_links', 'req_options'):
+                value = stmt.value
+                try:
+                    if isinstance(value, ast.Call) and isinstance(value.func, ast.Name) \
+                            and value.func.id == 'dict' and not value.args:
+                        conf[name] = { k.arg: ast.literal_eval(k.value) for k in value.keywords }
+                    else:
+                        conf[name] = ast.literal_eval(value)
+                except ValueError:
+                    pass
+    return conf
+
+def converters(req_options):
+    # the conversion of the custom options, used to evaluate the filters of the CSV imports
+    if not req_options:
+        return {}
+    from docutils.parsers.rst import directives
+    ret = {}
+    for k, v in req_options.items():
+        try:
+            ret[k] = eval(v, {'directives': directives})
+        except Exception:
+            pass
+    return ret
+
+class _Row(dict):
+    # the values used to evaluate a filter: None for an undefined option
+    def __missing__(self, key):
+        if key in FILTER_GLOBALS or hasattr(builtins, key):
+            raise KeyError(key)
+        return None
+
+def literal_ranges(buf):
+    # the (start, end) offsets of the literal blocks (examples), in order
+    starts = []
+    for mo in rLiteralEnd.finditer(buf):
+        bol = buf.rfind('\n', 0, mo.start()) + 1
+        if not buf[bol:mo.start()].lstrip().startswith('.. '):
+            starts.append((bol, mo.end()))
+    for mo in rLiteralDirective.finditer(buf):
+        bol = buf.rfind('\n', 0, mo.start()) + 1
+        if not buf[bol:mo.start()].strip():
+            starts.append((bol, mo.end()))
+    starts.sort()
+
+    ranges = []
+    end = 0
+    for bol, eol in starts:
+        if eol < end:
+            continue
+        line = buf[bol:eol]
+        indent = len(line) - len(line.lstrip())
+        # the block: the following lines, blank or more indented
+        pos = end = eol + 1
+        while pos < len(buf):
+            next_eol = buf.find('\n', pos)
+            if next_eol < 0:
+                next_eol = len(buf)
+            line = buf[pos:next_eol]
+            if line.strip():
+                if len(line) - len(line.lstrip()) <= indent:
+                    break
+                end = next_eol
+            pos = next_eol + 1
+        ranges.append((eol, end))
+    return ranges
+
+def in_ranges(ranges, starts, pos):
+    i = bisect.bisect_right(starts, pos) - 1
+    return i >= 0 and pos < ranges[i][1]
+
+def link_list(value):
+    return [x.strip() for x in value.split(',') if x.strip()]
+
+# _____________________________________________________________________________
+class Linter:
+
+    def __init__(self, links=None, options=None, root=None):
+        self.links = dict(links or {})
+        self.root = root        # the source directory, for the paths starting with /
+        self.link_names = set(self.links) | set(self.links.values())
+        self.options = options
+        self.converters = None  # created for the first filter
+        self.reqs = []          # (location, reqid, label, {link -> list of ids})
+        self.roles = []         # (location, role, target)
+        self.errors = []        # (location, message)
+
+    def error(self, location, message):
+        self.errors.append((location, message))
+
+    def add_req(self, location, options):
+        links = { l: link_list(options[l]) for l in self.link_names if options.get(l) }
+        self.reqs.append((location, options.get('reqid'), options.get('label') or None, links))
+
+    def scan_file(self, path, name=None):
+        name = name or path
+        with open(path, 'r', encoding='utf-8') as f:
+            buf = f.read()
+        literal = literal_ranges(buf)
+        starts = [x[0] for x in literal]
+
+        pos = 0
+        lineno = 1
+        for mo_req in rReq.finditer(buf):
+            lineno += buf.count('\n', pos, mo_req.start())
+            pos = mo_req.start()
+            if in_ranges(literal, starts, pos):
+                continue
+            options = {}
+            for line in mo_req['options'].splitlines():
+                # '    :key: value'
+                key, _, value = line[5:].partition(':')
+                options[key] = value.strip()
+            if 'csv-file' in options:
+                self.scan_csv(csv_path(path, options['csv-file'], self.root),
+                              (name, lineno), options.get('filter'))
+            else:
+                self.add_req((name, lineno), options)
+
+        pos = 0
+        lineno = 1
+        for mo in rRole.finditer(buf):
+            lineno += buf.count('\n', pos, mo.start())
+            pos = mo.start()
+            if in_ranges(literal, starts, pos):
+                continue
+            # in an inline literal?
+            bol = buf.rfind('\n', 0, pos) + 1
+            eol = buf.find('\n', pos)
+            line = buf[bol:eol if eol >= 0 else len(buf)]
+            if '``' in line and any(x.start() <= pos - bol < x.end() for x in rInlineLiteral.finditer(line)):
+                continue
+            target = mo['target']
+            if target.endswith('>') and '<' in target:
+                # :req:req:`text <target>`
+                target = target[target.rindex('<')+1:-1]
+            self.roles.append(((name, lineno), mo['role'], target.strip()))
+
+    def scan_csv(self, path, location, req_filter=None):
+        try:
+            f = open(path, 'rt', encoding='utf-8')
+        except OSError as e:
+            self.error(location, 'cannot read the CSV file: %s' % e)
+            return
+        code = None
+        if req_filter:
+            try:
+                code = compile(req_filter, '<filter>', 'eval')
+            except SyntaxError as e:
+                f.close()
+                self.error(location, 'invalid filter %s: %s' % (req_filter, e))
+                return
+        with f:
+            spamreader = csv.reader(f, delimiter=',')
+            fieldnames = next(spamreader, [])
+            for n, row in enumerate(spamreader):
+                options = dict(zip(fieldnames, row))
+                if code is not None:
+                    if self.converters is None:
+                        self.converters = converters(self.options)
+                    values = _Row(options)
+                    for k, conv in self.converters.items():
+                        if k in values:
+                            try:
+                                values[k] = conv(values[k])
+                            except Exception:
+                                pass
+                    try:
+                        if not eval(code, FILTER_GLOBALS, values):
+                            continue
+                    except Exception as e:
+                        self.error(location, 'cannot evaluate the filter on row %d of %s: %s' % (n+2, path, e))
+                        continue
+                self.add_req(location + ('%s, row %d' % (os.path.basename(path), n+2),), options)
+
+    def check(self):
+        # the index of the IDs and labels
+        index = {}
+        for location, reqid, label, links in self.reqs:
+            for x in (reqid, label):
+                if not x:
+                    continue
+                if x in index:
+                    self.error(location, '%s already defined at %s' % (x, _format(index[x])))
+                else:
+                    index[x] = location
+        labels = { label: reqid or label for location, reqid, label, links in self.reqs if label }
+
+        for location, reqid, label, links in self.reqs:
+            for l, ids in links.items():
+                for x in ids:
+                    if x not in index:
+                        self.error(location, '%s of %s: unknown requirement %s' % (l, reqid or label or '?', x))
+
+        for location, role, target in self.roles:
+            if target not in index:
+                self.error(location, ':req:%s: unknown requirement %s' % (role, target))
+
+        self.check_cycles(labels)
+        self.errors.sort(key=lambda x: x[0])
+        return self.errors
+
+    def check_cycles(self, labels):
+        # for each pair of links, a graph child -> parent (both directions merged)
+        for l, rl in self.links.items():
+            graph = {}
+            where = {}
+            for location, reqid, label, links in self.reqs:
+                key = reqid or label
+                if not key:
+                    continue
+                where.setdefault(key, location)
+                for x in links.get(l, ()):
+                    graph.setdefault(key, []).append(labels.get(x, x))
+                for x in links.get(rl, ()):
+                    graph.setdefault(labels.get(x, x), []).append(key)
+            for cycle in _cycles(graph):
+                cycle.sort()
+                # reported on the first requirement defined
+                location = next(where[x] for x in cycle if x in where)
+                self.error(location, 'cycle in %s: %s' % (l, ', '.join(cycle)))
+
+def _format(location):
+    # (file, line) or (file, line, CSV row)
+    s = '%s:%d' % location[:2]
+    if len(location) > 2:
+        s += ' (%s)' % location[2]
+    return s
+
+def _cycles(graph):
+    # the strongly connected components with more than one node (or a loop),
+    # iterative Tarjan algorithm
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    cycles = []
+    counter = 0
+    for start in graph:
+        if start in index:
+            continue
+        work = [(start, iter(graph[start]))]
+        index[start] = low[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            v, children = work[-1]
+            for w in children:
+                if w not in index:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(graph.get(w, ()))))
+                    break
+                elif w in on_stack:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == v:
+                            break
+                    if len(component) > 1 or v in graph.get(v, ()):
+                        cycles.append(component)
+    return cycles
+
+# _____________________________________________________________________________
+def main(argv=sys.argv[1:]):
+    parser = argparse.ArgumentParser(description='Check the requirements of ReST files, without Sphinx')
+    parser.add_argument("dir", nargs='?', default='.', help="Source directory")
+    parser.add_argument("-c", "--conf", default=None, help="Sphinx configuration file (default: <dir>/conf.py)")
+    parser.add_argument("-l", "--links", default=None, action='append', help="A link and its reverse link (e.g. parents:children), instead of req_links of conf.py")
+    parser.add_argument("--suffix", default='.rst', help="Suffix of the ReST files")
+    parser.add_argument("-x", "--exclude", default=None, action='append', help="Directories excluded (default: _build)")
+    args = parser.parse_args(argv)
+    if args.exclude is None:
+        args.exclude = ['_build']
+
+    conf = read_conf(args.conf or os.path.join(args.dir, 'conf.py'))
+    links = conf.get('req_links', {})
+    if args.links:
+        links = dict(x.split(':', 1) for x in args.links)
+
+    linter = Linter(links, conf.get('req_options'), args.dir)
+    for fn in find_files(args.dir, args.suffix, args.exclude):
+        linter.scan_file(os.path.join(args.dir, fn), fn)
+    errors = linter.check()
+    for location, message in errors:
+        print('%s: %s' % (_format(location), message))
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,9 +10,13 @@ Global process:
   (domain.data['reqs']) through domain.add_req method
 - Once all documents have been read and that domain.data['reqs'] is up-to-date:
 
-  - <env_updated>: Execute reqlist queries and convert to req attribute
-  - <env_updated>: process all pseudo attributes (from links) and replace with real values (text or ReqReference)
-  - <env_updated>: Add a target node for all ReqReference
+  - <env_updated>: Resolve the links between requirements and find the documents
+    depending on the requirements that changed (domain.data['docdeps'])
+  - <env_updated>: For those documents only:
+
+    - Execute reqlist queries and convert to req attribute
+    - process all pseudo attributes (from links) and replace with real values (text or ReqReference)
+    - Add a target node for all ReqReference
 
   - <doctree-resolved>: Then lastly process all ReqRefReference nodes to point to the corresponding (list of) ReqReference
 
@@ -22,14 +26,21 @@ Global process:
 import io
 import os
 import csv
+import json
+import shutil
 import pickle
+import hashlib
+import functools
+import contextlib
+import time
 import textwrap
+import tracemalloc
 import re
 
 import jinja2
 
 from docutils import nodes
-from docutils.parsers.rst import directives
+from docutils.parsers.rst import directives, roles
 from docutils.utils import DependencyList
 from docutils.io import StringOutput
 from docutils.transforms.references import Substitutions
@@ -37,6 +48,7 @@ from docutils.transforms.references import Substitutions
 import sphinx
 from sphinx.domains import Domain
 from sphinx.roles import XRefRole
+from sphinx.transforms.post_transforms import SphinxPostTransform
 from sphinx.util.docutils import SphinxDirective, SphinxRole
 from sphinx.util.template import SphinxRenderer, ReSTRenderer, LaTeXRenderer
 from sphinx.jinja2glue import SphinxFileSystemLoader
@@ -45,7 +57,9 @@ if sphinx.version_info>=(9,0,0):
     from sphinx.util.docutils import _parse_str_to_doctree
     from sphinx.environment import _CurrentDocument
 from sphinx.util import rst
-from sphinx.errors import SphinxError
+from sphinx.util import logging
+from sphinx.errors import SphinxError, ConfigError
+from sphinx.environment import CONFIG_OK
 
 from sphinx.application import Sphinx
 from sphinx.util.typing import ExtensionMetadata
@@ -53,12 +67,93 @@ from sphinx.writers.html5 import HTML5Translator
 from sphinx.writers.latex import LaTeXTranslator
 from sphinx.writers import text
 from sphinx.builders.text import TextBuilder
+from sphinx.builders import Builder
+
+from .__main__ import FILTER_GLOBALS
 
 # XXX HTML: links local to the page behave differently
 # XXX :req:req:`reqid` fails in reqlist content
 
 _DEBUG = False
 
+logger = logging.getLogger(__name__)
+
+# documents read during the current build
+_read_docnames = set()
+# documents already processed by env_updated during the current build
+_processed_docnames = set()
+# documents given to Builder.build, written during the current build
+# (None or ['__all__']: all the documents), see _wrap_build
+_build_docnames = None
+
+# used to count the requirements of a document without parsing it
+_rReqDirective = re.compile(r'^(?P<indent>[ \t]*)\.\. (?P<name>req:req|include)::(?P<arg>.*)$')
+_rReqOption = re.compile(r'^[ \t]+:(?P<key>[\w-]+):(?P<value>.*)$')
+
+#______________________________________________________________________________
+# Instrumentation (req_profile): phase -> [count, seconds, peak bytes]
+# The time of a phase includes the time of the phases called from it.
+# The peak is the maximum of the memory allocated during the phase, when
+# Python traces the allocations (python -X tracemalloc), 0 otherwise.
+# The phases of the reading are recorded per document in the domain data
+# (see doctree_read) to be collected from the reading processes.
+_profile = None
+_profile_start = 0.0
+# the phases being measured: [peak before the phase, peak of the phases it called]
+_peaks = []
+
+def _start():
+    # the peak of the allocated memory is reset at each phase boundary
+    if tracemalloc.is_tracing():
+        _peaks.append([tracemalloc.get_traced_memory()[1], 0])
+        tracemalloc.reset_peak()
+    return time.perf_counter()
+
+def _record(phase, start):
+    entry = _profile.setdefault(phase, [0, 0.0, 0])
+    entry[0] += 1
+    entry[1] += time.perf_counter() - start
+    if tracemalloc.is_tracing() and _peaks:
+        before, inner = _peaks.pop()
+        peak = max(inner, tracemalloc.get_traced_memory()[1])
+        entry[2] = max(entry[2], peak)
+        if _peaks:
+            # the peak of the calling phase, whose peak was reset
+            _peaks[-1][1] = max(_peaks[-1][1], before, peak)
+
+@contextlib.contextmanager
+def _timed(phase):
+    if _profile is None:
+        yield
+        return
+    start = _start()
+    try:
+        yield
+    finally:
+        _record(phase, start)
+
+def _profiled(phase):
+    # decorator, the function is called directly when not profiling
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profile is None:
+                return func(*args, **kwargs)
+            start = _start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(phase, start)
+        return wrapper
+    return decorator
+
+def _note_template_dependency(env, filename):
+    # a customized template in the source directory
+    # (a missing dependency would make the document outdated at every build)
+    path = os.path.join(env.srcdir, filename)
+    if os.path.isfile(path):
+        env.note_dependency(path)
+
 # typing of directive option to define links (list of IDs)
 def link(argument):
     if not argument.strip():
@@ -87,31 +182,63 @@ class ReqLinks(SphinxRole):
         p  = req_links_node('', **opts)
         return ([p], [])
 
+#______________________________________________________________________________
+# (renderer class, srcdir, prefix) -> renderer
+# The templates are compiled once per build (see config_inited)
+_renderers = {}
+
+def _get_renderer(cls, srcdir, prefix=False):
+    key = (cls, os.fspath(srcdir), prefix)
+    r = _renderers.get(key)
+    if r is None:
+        r = cls( [srcdir, os.path.dirname(__file__)] )
+        if prefix:
+            # the templates of the extension are also available as req/...
+            r.env.loader = jinja2.PrefixLoader({
+                '': r.env.loader,
+                'req': SphinxFileSystemLoader([os.path.dirname(__file__)])
+            })
+        # the templates do not change during a build
+        r.env.auto_reload = False
+        _renderers[key] = r
+    return r
+
+@functools.lru_cache(maxsize=128)
+def _get_inline_template(srcdir, source):
+    # content of a reqlist
+    return _get_renderer(ReSTRenderer, srcdir).env.from_string(source)
+
 #______________________________________________________________________________
 class req_node(nodes.Element):
     pass
 
+def _push_req(self, d):
+    # the end of the rendering of each req_node being visited (a stack: a
+    # requirement may be nested in another one)
+    self.__dict__.setdefault('_req_stack', []).append(d)
+
 def html_visit_req_node(self: HTML5Translator, node: req_node) -> None:
     if 'hidden' not in node.attributes:
-        r = SphinxRenderer( [self.builder.app.env.srcdir, os.path.dirname(__file__)] )
-        s = r.render('req.html.jinja2', node.attributes)
+        r = _get_renderer(SphinxRenderer, self.builder.app.env.srcdir)
+        with _timed('translate'):
+            s = r.render('req.html.jinja2', node.attributes)
         v,d = s.split('---CONTENT---')
         self.body.append(v)
-        self._req = d
+        _push_req(self, d)
 
 def latex_visit_req_node(self: LaTeXTranslator, node: req_node) -> None:
     if 'hidden' not in node.attributes:
-        r = LaTeXRenderer( [self.builder.app.env.srcdir, os.path.dirname(__file__)] )
-        s = r.render('req.latex.jinja2', node.attributes)
+        r = _get_renderer(LaTeXRenderer, self.builder.app.env.srcdir)
+        with _timed('translate'):
+            s = r.render('req.latex.jinja2', node.attributes)
         v,d = s.split('---CONTENT---')
         self.body.append(v)
-        self._req = d
+        _push_req(self, d)
 
 
 def depart_req_node(self: LaTeXTranslator, node: req_node) -> None:
     if 'hidden' not in node.attributes:
-        self.body.append(self._req)
-        self._req = None
+        self.body.append(self._req_stack.pop())
 
 class ReqDirective(SphinxDirective):
     """
@@ -132,6 +259,7 @@ class ReqDirective(SphinxDirective):
     }
 
     # Transform the directive into a list of docutils nodes
+    @_profiled('directive')
     def run(self):
         # For development
         if _DEBUG:
@@ -142,17 +270,18 @@ class ReqDirective(SphinxDirective):
             self.env.note_dependency(os.path.join(os.path.dirname(__file__), 'req.preamble'))
             self.env.note_dependency(os.path.join(os.path.dirname(__file__), 'req.css'))
             self.env.note_dependency(os.path.join(os.path.dirname(__file__), 'req.py'))
-        self.env.note_dependency(os.path.join(self.env.srcdir, 'req.rst.jinja2'))
+        _note_template_dependency(self.env, 'req.rst.jinja2')
 
         def _create_node(options):
             reqid = options.get('reqid',None)
             if reqid is None:
                 # generate a unique local id
-                docnames = list(self.env.app.project.docnames)
-                docnames.sort()
-                doc_idx = docnames.index(self.env.docname)
+                dom = self.env.get_domain('req')
+                doc_idx = dom.data['docindex'][self.env.docname]
                 # Propose a serial unique in the whole set of documents
-                reqid = self.env.config.req_idpattern.format(**dict(doc=doc_idx, doc_serial=self.env.new_serialno('req')+1, serial=self.env.get_domain('req').new_serial()))
+                doc_serial = self.env.new_serialno('req')+1
+                serial = dom.new_serial(self.env.docname, doc_serial)
+                reqid = self.env.config.req_idpattern.format(**dict(doc=doc_idx, doc_serial=doc_serial, serial=serial))
             options['reqid'] = reqid
             # create pseudo properties for links, they will be converted later on
             for l, rl in self.env.config.req_links.items():
@@ -167,35 +296,13 @@ class ReqDirective(SphinxDirective):
 
             node['ids'].append(targetid)
 
-            def my_wrap(text, width = 80, **kwargs):
-                return text.splitlines()
-
-            def _get_text(s):
-                builder = TextBuilder(self.env.app, self.env)
-                # do not wrap the lines (for long title)
-                owrap = text.my_wrap
-                text.my_wrap = my_wrap
-                writer = text.TextWriter(builder)
-                destination = StringOutput(encoding='utf-8')
-                doc = nodes.document(self.state.document.settings, self.state.document.reporter )
-                doc.substitution_defs = self.state.document.substitution_defs
-                doc += self.parse_text_to_nodes(s)
-                Substitutions(doc).apply()
-                writer.write(doc, destination)
-                # restore previous wrap function
-                text.my_wrap = owrap
-                return writer.output.strip()
-            options['text_content'] = node['text_content'] = _get_text(node['content'])
-            options['text_title'] = node['text_title'] = _get_text(node['title'])
+            options['text_content'] = node['text_content'] = _get_text(self, node['content'])
+            options['text_title'] = node['text_title'] = _get_text(self, node['title'])
 
             if 'hidden' not in options:
-                r = ReSTRenderer( [self.env.srcdir,os.path.dirname(__file__)] )
-                loader = jinja2.PrefixLoader({
-                    '': r.env.loader,
-                    'req': SphinxFileSystemLoader([os.path.dirname(__file__)])
-                })
-                r.env.loader = loader
-                s = r.render('/req.rst.jinja2', options)
+                r = _get_renderer(ReSTRenderer, self.env.srcdir, prefix=True)
+                with _timed('render'):
+                    s = r.render('/req.rst.jinja2', options)
 
                 sub_nodes = self.parse_text_to_nodes(s)
                 node += sub_nodes
@@ -219,31 +326,34 @@ class ReqDirective(SphinxDirective):
                 sort = self.options['sort']
                 del self.options['sort']
 
-            # Read the csv
+            # Same file imported the same way during a previous build?
+            cache_path = _csv_cache_path(self.env, relpath, self.lineno)
+            cache_key = _csv_cache_key(self.env.config, abspath, self.options, req_filter, sort)
+            # the cache files still used, see _prune_csv_cache
+            self.env.get_domain('req').data['csvcache'].setdefault(self.env.docname, set()).add(
+                os.path.basename(cache_path))
+            # a new environment (-E, configuration changed) is built without the cache
+            allreqs = _load_csv_cache(cache_path, cache_key) if self.env.config_status == CONFIG_OK else None
+            if allreqs is not None:
+                allnodes = []
+                for req_options in allreqs:
+                    allnodes.extend(_create_node(dict(req_options)))
+                return allnodes
+
+            # Read the csv, row by row: only the requirements passing the filter are kept
             allreqs = []
-            with open(abspath, 'rt') as csvfile:
-                spamreader = csv.reader(csvfile, delimiter=',')
-                fieldnames = next(spamreader)
-                if 'reqid' not in fieldnames and 'title' not in fieldnames and 'content' not in fieldnames:
-                    raise ReqException("Missing header row in %s" % abspath)
-                
-                for row in spamreader:
-                    options = {}
-                    options.update(self.options)
-                    for i in range(len(fieldnames)):
-                        v = fieldnames[i]
-                        if v in ReqDirective.option_spec:
-                            options[v] = ReqDirective.option_spec[v](row[i])
-                        else:
-                            options[v] = row[i]
-                    allreqs.append(options)
-            # apply filter and sorting
-            allreqs = _filter_and_sort(allreqs, req_filter, sort)
-
-            # create the nodes for the remaining requirements
             allnodes = []
-            for req_options in allreqs:
-                allnodes.extend(_create_node(req_options))
+            with open(abspath, 'rt') as csvfile:
+                reqs = _iter_filter(self._read_csv(csvfile, abspath), req_filter)
+                if sort:
+                    # all the requirements are needed to sort them
+                    reqs = _filter_and_sort(reqs, sort=sort)
+
+                # create the nodes for the remaining requirements
+                for req_options in reqs:
+                    allreqs.append(req_options)
+                    allnodes.extend(_create_node(dict(req_options)))
+            _save_csv_cache(cache_path, cache_key, allreqs, allnodes)
             return allnodes
 
         # only used if csv-file, ignore otherwise
@@ -270,69 +380,274 @@ class ReqDirective(SphinxDirective):
 
         return _create_node(self.options)
 
+    def _read_csv(self, csvfile, abspath):
+        spamreader = csv.reader(csvfile, delimiter=',')
+        fieldnames = next(spamreader)
+        if 'reqid' not in fieldnames and 'title' not in fieldnames and 'content' not in fieldnames:
+            raise ReqException("Missing header row in %s" % abspath)
+
+        # conversion of each column
+        converters = [ReqDirective.option_spec.get(v, str) for v in fieldnames]
+        for row in spamreader:
+            options = dict(self.options)
+            for i in range(len(fieldnames)):
+                options[fieldnames[i]] = converters[i](row[i])
+            yield options
+
 
 #______________________________________________________________________________
-def _filter_and_sort(reqs :list[req_node], filter :str=None, sort :str=None) -> list[req_node]:
-    # transform the filter to a function
-    if filter:
-        def _filter(r):
-            # Since custo attributes may not be defined on all requirements
-            # we are trying to set a default value (None) in case of error
-            d = dict()
-            d.update(globals())
-            while True:
-                try:
-                    x = eval(filter, d, r)
-                    return x
-                except NameError as exc:
-                    if exc.name in ReqDirective.option_spec.keys():
-                        d[exc.name] = None
-                    else:
-                        raise
-                else:
-                    raise
-        ff = _filter
-    else:
-        ff = lambda r: True
+# Conversion of title and content to plain text (text_title and text_content)
+
+# text with no character or beginning of line that could be a ReST markup
+_rPlainText = re.compile(r"(?:[^\W_]|[\n .,;!?'\"()%&+=/<>@#-])*", re.UNICODE)
+_rMarkupLine = re.compile(r"^(?:[\s.#(+/=-]|[^\W_]{1,3}[.)](?:\s|$))", re.UNICODE | re.MULTILINE)
+
+# source text -> plain text
+_text_cache = {}
+_TEXT_CACHE_SIZE = 50000
+# (env, writer) reused for all the requirements
+_text_writer = None
+
+def _no_wrap(text, width = 80, **kwargs):
+    # do not wrap the lines (for long title)
+    return text.splitlines()
+
+def _get_text_writer(env):
+    global _text_writer
+    if _text_writer is None or _text_writer[0] is not env:
+        builder = TextBuilder(env.app, env)
+        _text_writer = (env, text.TextWriter(builder))
+    return _text_writer[1]
+
+@_profiled('text')
+def _get_text(directive, s):
+    # nothing to interpret
+    if _rPlainText.fullmatch(s) and not _rMarkupLine.search(s):
+        return s.strip()
+
+    # the substitutions depend on the document
+    cacheable = '|' not in s
+    if cacheable and s in _text_cache:
+        return _text_cache[s]
+
+    writer = _get_text_writer(directive.env)
+    destination = StringOutput(encoding='utf-8')
+    doc = nodes.document(directive.state.document.settings, directive.state.document.reporter )
+    doc.substitution_defs = directive.state.document.substitution_defs
+    doc += directive.parse_text_to_nodes(s)
+    Substitutions(doc).apply()
+    owrap = text.my_wrap
+    text.my_wrap = _no_wrap
+    try:
+        writer.write(doc, destination)
+    finally:
+        # restore previous wrap function
+        text.my_wrap = owrap
+    ret = writer.output.strip()
+
+    if cacheable:
+        if len(_text_cache) >= _TEXT_CACHE_SIZE:
+            _text_cache.clear()
+        _text_cache[s] = ret
+    return ret
 
-    # Filter the input list
-    new_reqs = []
+#______________________________________________________________________________
+# Cache of the CSV imports, in the doctree directory: the converted (filtered and sorted)
+# rows and their text_title/text_content
+
+_CSV_CACHE_VERSION = 1
+
+def _csv_cache_path(env, relpath, lineno):
+    name = hashlib.md5(repr((env.docname, relpath, lineno)).encode('utf-8')).hexdigest()
+    return os.path.join(env.doctreedir, 'req-csv', name + '.pickle')
+
+def _converter_name(conv):
+    return '%s.%s' % (getattr(conv, '__module__', None), getattr(conv, '__qualname__', repr(conv)))
+
+def _stable_repr(value):
+    # repr() without the order of the sets and the addresses of the functions
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join(sorted('%s: %s' % (_stable_repr(k), _stable_repr(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return '{%s}' % ', '.join(sorted(_stable_repr(v) for v in value))
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(_stable_repr(v) for v in value)
+    if isinstance(value, type) or callable(value):
+        return _converter_name(value)
+    return repr(value)
+
+_config_hash = None
+
+def _get_config_hash(config):
+    # the configuration the rendering of text_title/text_content depends on
+    # (rst_prolog, default_role, the extensions, etc.), computed once per build
+    global _config_hash
+    if _config_hash is None:
+        values = sorted((x.name, _stable_repr(x.value)) for x in config.filter('env'))
+        _config_hash = hashlib.md5(repr((values, _stable_repr(config.extensions))).encode('utf-8')).hexdigest()
+    return _config_hash
+
+def _csv_cache_key(config, abspath, options, filter, sort):
+    h = hashlib.md5()
+    with open(abspath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    # the converters can also be set in conf.py, without req_options
+    converters = sorted((k, _converter_name(v)) for k, v in ReqDirective.option_spec.items())
+    return (_CSV_CACHE_VERSION, h.hexdigest(), repr(sorted(options.items())), filter, sort,
+            _get_config_hash(config), repr(converters))
+
+def _load_csv_cache(path, key):
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+    except Exception:
+        return None
+    if data[0] != key:
+        return None
+    if len(_text_cache) + len(data[2]) > _TEXT_CACHE_SIZE:
+        _text_cache.clear()
+    _text_cache.update(data[2])
+    return data[1]
+
+def _save_csv_cache(path, key, reqs, nodes):
+    texts = {}
+    for node in nodes:
+        for k in ('title', 'content'):
+            # the substitutions depend on the document
+            if '|' not in node[k]:
+                texts[node[k]] = node['text_'+k]
+    tmp = '%s.%d' % (path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            pickle.dump((key, reqs, texts), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception as e:
+        # the cache is optional (a value may not be picklable, etc.)
+        logger.warning('Cannot cache the CSV import in %s: %s', path, e, type='req', subtype='csv_cache')
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+
+def _prune_csv_cache(env, dom):
+    # remove the cache files of the imports that no longer exist (documents
+    # removed, imports moved or removed)
+    used = set()
+    for names in dom.data['csvcache'].values():
+        used.update(names)
+    dirname = os.path.join(env.doctreedir, 'req-csv')
+    try:
+        names = os.listdir(dirname)
+    except OSError:
+        return
+    for name in names:
+        if name not in used:
+            with contextlib.suppress(OSError):
+                os.unlink(os.path.join(dirname, name))
+
+#______________________________________________________________________________
+# filter expression -> code object
+_compiled_filters = {}
+
+def _compile_filter(filter :str):
+    code = _compiled_filters.get(filter)
+    if code is None:
+        code = _compiled_filters[filter] = compile(filter, '<filter>', 'eval')
+    return code
+
+def _iter_filter(reqs, filter :str=None, graph=None):
+    # Filter the requirements one by one, as they come
+    if not filter:
+        yield from reqs
+        return
+    code = _compile_filter(filter)
+    g = FILTER_GLOBALS
+    # The values used to evaluate a filter on each requirement.
+    # Since custo attributes may not be defined on all requirements
+    # they are given a default value (None)
+    defaults = dict.fromkeys(ReqDirective.option_spec.keys())
+    # the links between the requirements, if known
+    used = None
+    if graph is not None:
+        defaults.setdefault('graph', graph)
+        used = (set(code.co_names) & _GRAPH_NAMES) - defaults.keys()
     for req in reqs:
-        if ff(req):
-            new_reqs.append(req)
-    reqs = new_reqs
+        record = dict(defaults)
+        if used:
+            record.update(graph.filter_names(req, used))
+        record.update(req.attributes if isinstance(req, nodes.Element) else req)
+        if eval(code, g, record):
+            yield req
+
+def _filter_and_sort(reqs :list[req_node], filter :str=None, sort :str=None, graph=None) -> list[req_node]:
+    # Filter the input list
+    reqs = list(_iter_filter(reqs, filter, graph))
 
-    # sort the result
+    # sort the result, the first key having the highest precedence
     if sort:
         fs_list = [x.strip() for x in sort.split(',')]
-        for x in fs_list:
-            if x and x[0]=='-':
-                reqs.sort(key=lambda r, key=x: r.get(key[1:], ''), reverse=True)
-            else:
-                reqs.sort(key=lambda r, key=x: r.get(key, ''), reverse=False)
+        fs_list = [(x[1:], True) if x[0]=='-' else (x, False) for x in fs_list if x]
+        def _key(r):
+            return tuple(
+                _Reversed(_natural_key(r.get(key, ''))) if reverse else _natural_key(r.get(key, ''))
+                for key, reverse in fs_list
+            )
+        reqs.sort(key=_key)
     return reqs
 
+_rDigits = re.compile(r'(\d+)')
+
+def _natural_key(value):
+    # Make all values comparable (missing values first, then numbers, then
+    # text) and compare the numbers within the text by their value:
+    # REQ-0102 < REQ-01010
+    if value is None or value == '':
+        return (0,)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    parts = _rDigits.split(str(value))
+    parts[1::2] = [int(x) for x in parts[1::2]]
+    return (2, tuple(parts))
+
+class _Reversed:
+    # a sort key in the reverse order
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+#______________________________________________________________________________
+def _is_plain_cell(s):
+    # A value that would be parsed into a simple paragraph, unchanged
+    # (not even by the smart quotes or the detection of emails)
+    return bool(_rPlainText.fullmatch(s)) and not _rMarkupLine.search(s) \
+        and not any(c in s for c in '\'"@') and '--' not in s and '..' not in s
+
 class reqlist_node(nodes.Element):
     def get_list(self, dom):
-        # Get the list of all requirements
-        reqs = []
-        for data in dom.data['reqs']:
-            reqs.append(data[1])
+        # filter and sort (the result is shared, do not modify it)
+        return dom.query(self['filter'], self['sort'])
 
-        # filter and sort
-        reqs = _filter_and_sort(reqs, self['filter'], self['sort'])
-        return reqs
-
-    def fill(self, dom, app, doctree, fromdocname):
+    @_profiled('fill')
+    def fill(self, dom, app, doctree, fromdocname, new_id):
+        # new_id() gives the ids of the tables, numbered in the scope of the document
         if _DEBUG:
             print('----- fill ----- ' + fromdocname)
 
         # Get the list of all requirements
         reqs = self.get_list(dom)
+        if app.builder.name == 'reqexport':
+            # the documents are not written: only the requirements listed are needed
+            return reqs
 
         # evaluate the content
         if 'hidden' not in self.attributes:
-            r = ReSTRenderer( [app.srcdir, os.path.dirname(__file__)] )
             kwargs = dict(
                 reqs=reqs,
                 caption=self['caption'],
@@ -343,32 +658,137 @@ class reqlist_node(nodes.Element):
                 stub_columns=self['stub-columns'],
                 fields=self['fields'],
                 headers=self['headers'],
+                graph=dom.graph,
             )
-            if self['content']:
-                s = r.render_string(self['content'], kwargs)
+            table = None
+            if not self['content'] and not os.path.exists(os.path.join(app.srcdir, 'reqlist.rst.jinja2')):
+                table = self.build_table(app, reqs, new_id)
+
+            if table is not None:
+                children = [table]
             else:
-                s = r.render('reqlist.rst.jinja2', kwargs)
+                with _timed('render'):
+                    if self['content']:
+                        s = _get_inline_template(os.fspath(app.srcdir), self['content']).render(kwargs)
+                    else:
+                        s = _get_renderer(ReSTRenderer, app.srcdir).render('reqlist.rst.jinja2', kwargs)
+
+                document = self.read_doc(app, s)
 
-            document = self.read_doc(app, s)
+                # fix any ids that could be duplicated due to a local env
+                # for now, only with table
+                for node in document.traverse(nodes.table):
+                    if 'ids' in node and node['ids'] and node['ids'][0].startswith('id'):
+                        node['ids'] = [new_id()]
+                children = document.children
 
             # fix docname in all nodes of the document
             # fix also the corresponding data in env
-            for node in document.traverse(ReqReference):
-                node['refdoc'] = fromdocname
+            for child in children:
+                for node in child.traverse(ReqReference):
+                    node['refdoc'] = fromdocname
 
-            # fix any ids that could be duplicated due to a local env
-            # for now, only with table
-            for node in document.traverse(nodes.table):
-                if 'ids' in node and node['ids'] and node['ids'][0].startswith('id'):
-                    node['ids'] = ['reqlist%d'  % app.env.new_serialno('reqlist')]
+            self += children
 
-            self += document.children
+        return reqs
+
+    def build_table(self, app, reqs, new_id):
+        # Build the table of the default template (reqlist.rst.jinja2) directly:
+        # only the cells (and caption) with some markup are parsed, all at once.
+        # Return None if the ReST must be parsed as a whole (empty list, options in error, etc.)
+        fields = self['fields']
+        headers = self['headers']
+        if not reqs or len(headers) != len(fields):
+            return None
+        try:
+            align = directives.choice(self['align'], ('left', 'center', 'right'))
+            width = directives.length_or_percentage_or_unitless(self['width'])
+            widths = directives.value_or(('auto', ), directives.positive_int_list)(self['widths'])
+            header_rows = directives.nonnegative_int(self['header-rows'])
+            stub_columns = directives.nonnegative_int(self['stub-columns'])
+        except ValueError:
+            return None
+        if isinstance(widths, list) and len(widths) != len(fields):
+            return None
+        if header_rows > len(reqs) or stub_columns >= len(fields):
+            return None
+
+        # same values as the template: req[f]|default('')|string
+        jenv = _get_renderer(ReSTRenderer, app.srcdir).env
+        rows = [[h.strip() for h in headers]]
+        for req in reqs:
+            row = []
+            for f in fields:
+                v = jenv.getitem(req, f)
+                row.append('' if isinstance(v, jinja2.Undefined) else str(v).strip())
+            rows.append(row)
+
+        # parse the values with markup as the items of a single list
+        caption = self['caption']
+        markup = dict.fromkeys(s for row in rows for s in row if s and not _is_plain_cell(s))
+        if caption and not _is_plain_cell(caption):
+            markup[caption] = None
+        if markup:
+            text = '\n'.join('- ' + textwrap.indent(s, '  ')[2:] + '\n' for s in markup)
+            document = self.read_doc(app, text)
+            # the list follows the nodes of rst_prolog (if any)
+            if not len(document) or not isinstance(document[-1], nodes.bullet_list) \
+                    or len(document[-1]) != len(markup):
+                return None
+            for s, item in zip(list(markup), document[-1]):
+                markup[s] = item.children
+
+        table = nodes.table()
+        if widths == 'auto':
+            table['classes'] += ['colwidths-auto']
+            widths = [100 // len(fields)] * len(fields)
+        else:
+            table['classes'] += ['colwidths-given']
+        if caption:
+            if caption in markup:
+                # the caption is inline text
+                if len(markup[caption]) != 1 or not isinstance(markup[caption][0], nodes.paragraph):
+                    return None
+                table += nodes.title(caption, '', *markup[caption][0].children)
+            else:
+                table += nodes.title(caption, caption)
+            table['ids'] = [new_id()]
+        tgroup = nodes.tgroup(cols=len(widths))
+        table += tgroup
+        for i, w in enumerate(widths):
+            colspec = nodes.colspec(colwidth=w)
+            if i < stub_columns:
+                colspec['stub'] = 1
+            tgroup += colspec
+        row_nodes = []
+        for row in rows:
+            row_node = nodes.row()
+            for s in row:
+                entry = nodes.entry()
+                if s in markup:
+                    # a copy, the same value may be used several times
+                    entry += [n.deepcopy() for n in markup[s]]
+                elif s:
+                    entry += nodes.paragraph(s, s)
+                row_node += entry
+            row_nodes.append(row_node)
+        if header_rows:
+            thead = nodes.thead()
+            thead.extend(row_nodes[:header_rows])
+            tgroup += thead
+        tbody = nodes.tbody()
+        tbody.extend(row_nodes[header_rows:])
+        tgroup += tbody
+        table['align'] = align
+        table['width'] = width
+        return table
 
     def read_doc(self, app, s):
         # parse the resulting string (from sphinx.builders.Builder.read_doc)
         # with the directives and roles active
 
         if sphinx.version_info<(8,0,0):
+            temp_data = app.env.temp_data.copy()
             app.env.prepare_settings('reqlist.rst')
             publisher = app.registry.get_publisher(app, 'restructuredtext')
             publisher.settings.record_dependencies = DependencyList()
@@ -376,9 +796,12 @@ class reqlist_node(nodes.Element):
                 publisher.set_source(source=io.StringIO(s), source_path='reqlist.rst')
                 publisher.publish()
                 document = publisher.document
+            # restore the document being read or written (the default domain
+            # of reqlist.rst, with its roles, cannot be pickled with the environment)
+            app.env.temp_data = temp_data
         elif sphinx.version_info<(9,0,0):
             # Sphinx 8
-            sn = app.env.current_document._serial_numbers
+            current_document = app.env.current_document
             app.env.prepare_settings('reqlist.rst')
             publisher = app.registry.get_publisher(app, 'restructuredtext')
             publisher.settings.record_dependencies = DependencyList()
@@ -386,7 +809,9 @@ class reqlist_node(nodes.Element):
                 publisher.set_source(source=io.StringIO(s), source_path='reqlist.rst')
                 publisher.publish()
                 document = publisher.document
-            app.env.current_document._serial_numbers = sn
+            # restore the document being read or written (the default domain
+            # of reqlist.rst, with its roles, cannot be pickled with the environment)
+            app.env.current_document = current_document
         else:
             env  = app.env
             sn = env.current_document._serial_numbers
@@ -418,25 +843,9 @@ class reqlist_node(nodes.Element):
         return document        
 
 def visit_reqlist_node(self, node: reqlist_node) -> None:
-    if 'csv-file' in node.attributes:
-        dom = self.builder.env.get_domain('req')
-        # Get the list of all requirements
-        reqs = node.get_list(dom)
-
-        # dump in a CSV
-        fn = node['csv-file']
-        fn = os.path.join(self.builder.outdir, fn)
-        dirname = os.path.dirname(fn)
-        if dirname:
-            os.makedirs(dirname, exist_ok=True)
-        with open(fn, 'wt') as csvfile:
-            wr = csv.writer(csvfile, delimiter=',')
-            if 'headers' in node.attributes:
-                wr.writerow(node['headers'])
-            else:
-                wr.writerow(node['fields'])
-            for r in reqs:
-                wr.writerow([r.get(x, '') for x in node['fields']])
+    # nothing to render, the list has been replaced by its content in env_updated
+    # and the CSV export is done once for all the documents (see env_updated)
+    return
 
 def depart_reqlist_node(self, node: reqlist_node) -> None:
     return
@@ -464,10 +873,11 @@ class ReqListDirective(SphinxDirective):
         'widths': directives.unchanged,
         }
 
+    @_profiled('directive')
     def run(self):
         # Simply insert an empty reqlist node which will be replaced later
         # when process_req_nodes is called
-        self.env.note_dependency(os.path.join(self.env.srcdir, 'reqlist.rst.jinja2'))
+        _note_template_dependency(self.env, 'reqlist.rst.jinja2')
 
         node = reqlist_node('')
 
@@ -509,6 +919,287 @@ class ReqReference(nodes.reference):
 class ReqRefReference(nodes.reference):
     pass
 
+#______________________________________________________________________________
+# names available in the filters, depending on the links between the requirements
+# (see ReqGraph.filter_names)
+_GRAPH_NAMES = {'graph', 'descendant_of', 'ancestor_of', 'uncovered', 'depth', 'cycle'}
+
+def _uses_graph(filter):
+    return bool(filter) and not _GRAPH_NAMES.isdisjoint(_compile_filter(filter).co_names)
+
+#______________________________________________________________________________
+class ReqGraph:
+    """
+    The links between all the requirements, built once per build.
+
+    Each requirement has an index (in the order of the documents) and, for each
+    link name (both directions of ``req_links``), ``adjacency[link][i]`` is the list
+    of the indexes of the requirements linked to the requirement ``i``.
+    IDs used in a link without any requirement are indexed after the requirements.
+
+    It is available as ``graph`` in the filters and the templates of req:reqlist.
+    The first pair of ``req_links`` gives the default links: up (e.g. parents)
+    and down (e.g. children).
+    """
+
+    def __init__(self, reqs, links, labels, link_name, up=None, down=None):
+        self.up = up
+        self.down = down
+        self.link_name = link_name
+        # results computed once, see _memoize
+        self._memo = {}
+        self.reqs = list(reqs)
+        self.reqids = [req['reqid'] for req in self.reqs]
+        self.index = { reqid: i for i, reqid in enumerate(self.reqids) }
+        self.labels = labels
+        self.adjacency = { l: [[] for i in self.reqids] for l in link_name }
+        for reqid, req_links in links.items():
+            i = self.index[reqid]
+            for l, ids in req_links.items():
+                rl = link_name[l]
+                for x in ids:
+                    # if a label, we need to translate
+                    j = self._index(labels.get(x, x))
+                    self.adjacency[l][i].append(j)
+                    self.adjacency[rl][j].append(i)
+        # once, sorted by id
+        for adjacency in self.adjacency.values():
+            for i, a in enumerate(adjacency):
+                if a:
+                    adjacency[i] = sorted(set(a), key=self.reqids.__getitem__)
+
+    def _index(self, reqid):
+        i = self.index.get(reqid)
+        if i is None:
+            # unknown requirement
+            i = self.index[reqid] = len(self.reqids)
+            self.reqids.append(reqid)
+            for adjacency in self.adjacency.values():
+                adjacency.append([])
+        return i
+
+    def _get_index(self, reqid):
+        if isinstance(reqid, int):
+            return reqid
+        return self.index[self.labels.get(reqid, reqid)]
+
+    def get(self, reqid):
+        """The requirement (None if not defined)"""
+        i = self.index.get(self.labels.get(reqid, reqid))
+        if i is None or i >= len(self.reqs):
+            return None
+        return self.reqs[i]
+
+    def linked(self, reqid, link):
+        """The IDs of the requirements directly linked to reqid"""
+        return [self.reqids[j] for j in self.adjacency[link][self._get_index(reqid)]]
+
+    def _walk(self, start, link):
+        # the indexes reached from start (excluded), breadth first
+        adjacency = self.adjacency[link]
+        seen = bytearray(len(self.reqids))
+        seen[start] = 1
+        result = [start]
+        for i in result:
+            for j in adjacency[i]:
+                if not seen[j]:
+                    seen[j] = 1
+                    result.append(j)
+        return result[1:]
+
+    def _memoize(self, key, compute):
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = compute()
+            return value
+
+    def _reachable(self, reqid, link):
+        # set of the indexes reached from reqid
+        i = self.index.get(self.labels.get(reqid, reqid))
+        if i is None:
+            return frozenset()
+        return self._memoize(('reach', link, i), lambda: frozenset(self._walk(i, link)))
+
+    def _depths(self, link):
+        # for each index, the distance to the closest requirement without link (None if none)
+        def compute():
+            adjacency = self.adjacency[link]
+            reverse = self.adjacency[self.link_name[link]]
+            n = len(self.reqs)
+            depths = [None] * len(self.reqids)
+            queue = [i for i in range(n) if not adjacency[i]]
+            for i in queue:
+                depths[i] = 0
+            for i in queue:
+                for j in reverse[i]:
+                    if j < n and depths[j] is None:
+                        depths[j] = depths[i] + 1
+                        queue.append(j)
+            return depths
+        return self._memoize(('depth', link), compute)
+
+    def _cycles(self, link):
+        # set of the indexes in a cycle (strongly connected components, iterative Tarjan)
+        def compute():
+            adjacency = self.adjacency[link]
+            n = len(adjacency)
+            index = [-1] * n
+            low = [0] * n
+            onstack = bytearray(n)
+            stack = []
+            counter = 0
+            cycles = set()
+            for root in range(n):
+                if index[root] >= 0:
+                    continue
+                work = [(root, 0)]
+                while work:
+                    v, k = work.pop()
+                    if k == 0:
+                        index[v] = low[v] = counter
+                        counter += 1
+                        stack.append(v)
+                        onstack[v] = 1
+                    for k in range(k, len(adjacency[v])):
+                        w = adjacency[v][k]
+                        if index[w] < 0:
+                            # visit w, then continue with v
+                            work.append((v, k+1))
+                            work.append((w, 0))
+                            break
+                        elif onstack[w]:
+                            low[v] = min(low[v], index[w])
+                    else:
+                        if low[v] == index[v]:
+                            component = []
+                            while True:
+                                w = stack.pop()
+                                onstack[w] = 0
+                                component.append(w)
+                                if w == v:
+                                    break
+                            if len(component) > 1 or v in adjacency[v]:
+                                cycles.update(component)
+                        if work:
+                            u = work[-1][0]
+                            low[u] = min(low[u], low[v])
+            return frozenset(cycles)
+        return self._memoize(('cycle', link), compute)
+
+    def descendants(self, reqid, link=None):
+        """The IDs of all the requirements reached following the link from reqid, closest first"""
+        return [self.reqids[j] for j in self._walk(self._get_index(reqid), link or self.down)]
+
+    def ancestors(self, reqid, link=None):
+        """The IDs of all the requirements reached following the link (default up) from reqid"""
+        return self.descendants(reqid, link or self.up)
+
+    def orphans(self, link):
+        """The IDs of the requirements not linked to any other with the link"""
+        adjacency = self.adjacency[link]
+        return [self.reqids[i] for i in range(len(self.reqs)) if not adjacency[i]]
+
+    def depth(self, reqid, link=None):
+        """The number of links (default up) to the closest requirement without this link"""
+        return self._depths(link or self.up)[self._get_index(reqid)]
+
+    def in_cycle(self, reqid, link=None):
+        """True if reqid can be reached from itself following the link (default up)"""
+        return self._get_index(reqid) in self._cycles(link or self.up)
+
+    def filter_names(self, req, used):
+        # the names, among used, available in a filter evaluated for req
+        i = self.index[req['reqid']]
+        names = {}
+        if 'descendant_of' in used:
+            names['descendant_of'] = lambda reqid, link=None: i in self._reachable(reqid, link or self.down)
+        if 'ancestor_of' in used:
+            names['ancestor_of'] = lambda reqid, link=None: i in self._reachable(reqid, link or self.up)
+        if 'uncovered' in used:
+            names['uncovered'] = lambda link=None: not self.adjacency[link or self.down][i]
+        if 'depth' in used:
+            names['depth'] = self._depths(self.up)[i]
+        if 'cycle' in used:
+            names['cycle'] = i in self._cycles(self.up)
+        return names
+
+#______________________________________________________________________________
+# the nodes making a document depend on the requirements
+_REQ_CONTENT = (req_node, reqlist_node, req_links_node, ReqReference, ReqRefReference)
+
+# the names of the links, shared by all the records (and pickled once)
+_link_tuples = {}
+
+class ReqRecord:
+    """
+    A requirement in the domain data: the values of its fields, without the
+    nodes rendered in the document.
+
+    It is used like the req_node it comes from in the filters and the templates
+    (``req['title']``, ``req.get('priority')``), including the pseudo attributes
+    of the links (``req['_parents']``).
+    """
+
+    # private names: the templates (jinja) fall back to the attributes for the
+    # fields not defined (req['label'] on a requirement without label)
+    __slots__ = ('_reqid', '_label', '_docname', '_anchor', '_fields', '_links')
+
+    def __init__(self, node, docname, links=()):
+        links = _link_tuples.setdefault(tuple(links), tuple(links))
+        self._reqid = node['reqid']
+        self._label = node.get('label') or None
+        self._docname = docname
+        self._anchor = 'req-' + self._reqid
+        self._links = links
+        self._fields = {
+            k: v for k, v in node.attributes.items()
+            if k not in nodes.Element.list_attributes and not (k[:1] == '_' and k[1:] in links)
+        }
+
+    def _pseudo(self, key):
+        # the pseudo attribute of a link, rendered with the role req:links
+        if key[:1] == '_' and key[1:] in self._links:
+            return ':req:links:`{}::{}`'.format(key[1:], self._reqid)
+        return None
+
+    def __getitem__(self, key):
+        try:
+            return self._fields[key]
+        except KeyError:
+            v = self._pseudo(key)
+            if v is None:
+                raise
+            return v
+
+    def __setitem__(self, key, value):
+        self._fields[key] = value
+
+    def __contains__(self, key):
+        return key in self._fields or self._pseudo(key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._fields) + ['_' + l for l in self._links]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def node(self, env):
+        # the req_node in its document (from the pickled doctree, not resolved)
+        for node in env.get_doctree(self._docname).findall(req_node):
+            if node['reqid'] == self._reqid:
+                return node
+        return None
+
+    def __repr__(self):
+        return '<ReqRecord %s (%s)>' % (self._reqid, self._docname)
+
 #______________________________________________________________________________
 class ReqDomain(Domain):
     name = 'req'
@@ -525,17 +1216,75 @@ class ReqDomain(Domain):
     }
 
     initial_data = {
-        'reqs': [],  # object list
-        'N': 1,
-        'serial': 1,
-        'reqrefs' : [],
+        'reqs': {},     # reqid -> (name, ReqRecord, typ, docname, anchor, prio)
+        'labels': {},   # label -> reqid
+        'N': {},        # docname -> last number used for a ReqReference target
+        'serial': 1,    # first serial not reserved for a document
+        'serial_step': 1,       # see new_serial
+        'overflow': set(),      # docnames with more generated IDs than reserved, see new_serial
+        'serials': {},  # docname -> serials reserved (range or list), see env_get_outdated
+        'docindex': {}, # docname -> doc used in req_idpattern, see env_get_outdated
+        'idcounts': {}, # docname -> number of generated IDs in its source, see env_get_outdated
+        'reqrefs' : {}, # reftarget -> list of (name, reftarget, typ, docname, anchor, prio)
+        'docrefs' : {}, # docname -> list of (name, reftarget, typ, docname, anchor, prio)
+        'links': {},    # reqid -> {link -> list of ids or labels}, as defined by the requirement
+        'fingerprints': {},     # (builder, outdir) -> reqid -> hash of the requirement written there
+        'reqref_targets': {},   # reftarget -> list of (docname, targetid) used for :req:ref:
+        'written_reqrefs': {},  # (builder, outdir) -> reqref_targets written there
+        'docdeps': {},  # docname -> dict(reqids=set, reqrefs=set, filters=list), see _process_doc
+        'reqdocs': set(),       # docnames with some content of this extension, see doctree_read
+        'csvexports': {},       # docname -> list of the reqlist exported to CSV, see doctree_read
+        'csvcache': {}, # docname -> set of the names of the CSV cache files used
+        'profile': {},  # docname -> phase -> [count, seconds] when reading it (req_profile)
     }
-    data_version = 0
+    data_version = 15
+
+    def __init__(self, env):
+        super().__init__(env)
+        # (filter, sort, generation) -> list of requirements
+        # the generation changes each time the requirements are modified
+        self.generation = 0
+        self._queries = {}
+        # links between the requirements (ReqGraph), see _resolve_links
+        self.graph = None
+
+    def invalidate_queries(self):
+        self.generation += 1
+        self._queries = {}
+
+    def query(self, filter=None, sort=None):
+        # The requirements selected by a filter and sorted, computed once for
+        # all the reqlist using the same expressions
+        key = (filter, sort, self.generation)
+        reqs = self._queries.get(key)
+        if reqs is None:
+            if filter:
+                # filtering the sorted list keeps the order
+                reqs = self.query(None, sort)
+                with _timed('query'):
+                    reqs = _filter_and_sort(reqs, filter, graph=self.graph)
+            else:
+                with _timed('query'):
+                    # Get the list of all requirements, in the order of the documents
+                    # (as in a complete build, whatever the order the documents are read in)
+                    reqs = [data[1] for data in sorted(self.data['reqs'].values(), key=lambda x: x[3])]
+                    reqs = _filter_and_sort(reqs, None, sort)
+            self._queries[key] = reqs
+        return reqs
 
-    def new_serial(self):
-        current = self.data['serial']
-        self.data['serial'] = current + 1
-        return current
+    def new_serial(self, docname, doc_serial):
+        # Each document has its own range of serials, computed before reading
+        # (see env_get_outdated), so that the result does not depend on the
+        # order the documents are read or on the process reading them
+        serials = self.data['serials'].get(docname, ())
+        if doc_serial <= len(serials):
+            return serials[doc_serial - 1]
+        # more requirements than expected: the next serials are interleaved
+        # between the documents, after the reserved ones, so that they do not
+        # depend on the other documents (read by another process, etc.)
+        n = doc_serial - len(serials) - 1
+        self.data['overflow'].add(docname)
+        return self.data['serial'] + n * self.data['serial_step'] + self.data['docindex'][docname]
 
     def get_full_qualified_name(self, node):
         if type(node) is ReqReference:
@@ -545,62 +1294,123 @@ class ReqDomain(Domain):
         return node['reqid']
 
     def get_objects(self):
-        for x in self.data['reqs']:
+        for x in self.data['reqs'].values():
             yield (x[0], x[1]['reqid'], x[2], x[3], x[4], x[5])
 
+    def add_reqref_entry(self, entry):
+        self.data['reqrefs'].setdefault(entry[1], []).append(entry)
+        self.data['docrefs'].setdefault(entry[3], []).append(entry)
+
+    def clear_reqrefs(self, docname):
+        # remove the ReqReference of a document, before processing it again
+        entries = self.data['docrefs'].pop(docname, [])
+        for target in set(x[1] for x in entries):
+            remaining = [x for x in self.data['reqrefs'][target] if x[3]!=docname]
+            if remaining:
+                self.data['reqrefs'][target] = remaining
+            else:
+                del self.data['reqrefs'][target]
+        self.data['N'].pop(docname, None)
+
     def clear_doc(self, docname):
+        self.clear_docs({docname})
+
+    def clear_docs(self, docnames):
+        # remove all objects from the documents, at once
         if _DEBUG:
-            print('------------- clear_doc %s ----------------' % (docname,) )
+            print('------------- clear_docs %s ----------------' % (sorted(docnames),) )
             print(len(self.data['reqs']), len(self.data['reqrefs']))
-        # remove all objects from docname
-        self.data['reqs'] = list(filter(lambda x: x[3]!=docname, self.data['reqs']))
-        self.data['reqrefs'] = list(filter(lambda x: x[3]!=docname, self.data['reqrefs']))
+        self.invalidate_queries()
+        self.data['reqs'] = { reqid: x for reqid, x in self.data['reqs'].items() if x[3] not in docnames }
+        self.data['labels'] = { label: reqid for label, reqid in self.data['labels'].items() if reqid in self.data['reqs'] }
+        self.data['links'] = { reqid: x for reqid, x in self.data['links'].items() if reqid in self.data['reqs'] }
+        for docname in docnames:
+            self.clear_reqrefs(docname)
+            self.data['docdeps'].pop(docname, None)
+            self.data['reqdocs'].discard(docname)
+            self.data['overflow'].discard(docname)
+            self.data['csvexports'].pop(docname, None)
+            self.data['csvcache'].pop(docname, None)
+            self.data['profile'].pop(docname, None)
         if _DEBUG:
             print(len(self.data['reqs']), len(self.data['reqrefs']))
 
+    def merge_domaindata(self, docnames, otherdata):
+        # called when reading in parallel, otherdata comes from a worker process
+        self.invalidate_queries()
+        for entry in otherdata['reqs'].values():
+            if entry[3] in docnames:
+                self._add_req_entry(entry)
+                reqid = entry[1]['reqid']
+                if reqid in otherdata['links']:
+                    self.data['links'][reqid] = otherdata['links'][reqid]
+        for docname in docnames:
+            for entry in otherdata['docrefs'].get(docname, []):
+                self.add_reqref_entry(entry)
+        for docname in docnames:
+            if docname in otherdata['N']:
+                self.data['N'][docname] = otherdata['N'][docname]
+        self.data['reqdocs'].update(d for d in otherdata['reqdocs'] if d in docnames)
+        self.data['overflow'].update(d for d in otherdata['overflow'] if d in docnames)
+        for docname in docnames:
+            if docname in otherdata['csvexports']:
+                self.data['csvexports'][docname] = otherdata['csvexports'][docname]
+            if docname in otherdata['csvcache']:
+                self.data['csvcache'][docname] = otherdata['csvcache'][docname]
+            if docname in otherdata['profile']:
+                self.data['profile'][docname] = otherdata['profile'][docname]
+
     def add_req(self, req, docname):
         if _DEBUG:
             print ('Adding req ' + req['reqid'] + ' from ' + docname)
 
+        link_names = list(self.env.config.req_links.keys()) + list(self.env.config.req_links.values())
+        record = ReqRecord(req, docname, link_names)
+        self._add_req_entry((
+            'req-'+record._reqid,  # the unique key to the requirement (fixed prefix + ID)
+            record,             # the values of the requirement (not the node)
+            'req',              # the type of node
+            docname,            # the docname for this requirement
+            record._anchor,     # the anchor name, used in reference/target
+            0,                  # the priority
+        ))
+
+        # keep the links as defined, they will be completed with the reverse
+        # links and stored in the record (see _resolve_links)
+        self.data['links'][record._reqid] = { l: list(req[l]) for l in link_names if l in req.attributes }
+
+    def _add_req_entry(self, entry):
+        req = entry[1]
+        self.invalidate_queries()
+
         # reqid MUST be unique
-        match = [req2
-            for name2, req2, typ2, docname2, anchor2, prio2 in self.data['reqs']
-            if req['reqid']==req2['reqid'] or req['reqid']==req2.attributes.get('label', 'LABEL_UNDEF2')
-        ]
-        if match:
+        if req['reqid'] in self.data['reqs'] or req['reqid'] in self.data['labels']:
             msg = "Requirement ID must be unique. "+req['reqid']+" was defined multiple times, either as a reqid or as a label"
             raise SphinxError(msg)
 
         # if defined, label MUST be unique
-        if 'label' in req.attributes:
-            match = [req2
-                for name2, req2, typ2, docname2, anchor2, prio2 in self.data['reqs']
-                if req['label']==req2['reqid'] or req['label']==req2.attributes.get('label', 'LABEL_UNDEF2')
-            ]
-            if match:
-                msg = "Requirement label must be unique. "+req['label']+" was defined multiple times, either as a reqid or as a label"
+        label = req._label
+        if label:
+            if label in self.data['reqs'] or label in self.data['labels']:
+                msg = "Requirement label must be unique. "+label+" was defined multiple times, either as a reqid or as a label"
                 raise SphinxError(msg)
+            self.data['labels'][label] = req['reqid']
 
-        name = 'req-'+req['reqid']
-        anchor = 'req-'+req['reqid']
-        self.data['reqs'].append((
-            name,               # the unique key to the requirement (fixed prefix + ID)
-            req,                # the node itself
-            'req',              # the type of node
-            docname,            # the docname for this requirement
-            anchor,             # the anchor name, used in reference/target
-            0,                  # the priority
-        ))
+        self.data['reqs'][req['reqid']] = entry
 
     def add_reqref(self, reqref, target, docname):
         if _DEBUG:
             print ('Adding reqref ' + target + ' from ' + docname)
-        name = target + '-' + '%06d'%self.data['N']
-        self.data['N'] += 1
+        # numbered in the scope of the document: the target ids of a document
+        # do not depend on the other documents, and are unique once the
+        # documents are merged (singlehtml, etc.) thanks to a hash of the docname
+        n = self.data['N'].get(docname, 0) + 1
+        self.data['N'][docname] = n
+        name = '%s-%s-%06d' % (target, _docname_hash(docname), n)
         reqref['targetid'] = name
-        self.data['reqrefs'].append((
+        self.add_reqref_entry((
             name,
-            reqref,
+            target,             # only the target, not the node
             'reqref',
             docname,
             name,
@@ -608,30 +1418,278 @@ class ReqDomain(Domain):
         ))
         return name
 
+@functools.lru_cache(maxsize=None)
+def _docname_hash(docname):
+    return hashlib.md5(docname.encode('utf-8')).hexdigest()[:8]
+
+#______________________________________________________________________________
+def _count_generated_ids(env, docname, path=None, seen=None):
+    # Number of requirements of a document without a reqid (i.e. requiring a
+    # generated one), found by scanning the source file and the files it includes
+    if path is None:
+        path = env.doc2path(docname)
+        seen = set()
+    if path in seen:
+        return 0
+    seen.add(path)
+    try:
+        with open(path, 'rt', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return 0
+
+    count = 0
+    i = 0
+    while i < len(lines):
+        mo = _rReqDirective.match(lines[i])
+        i += 1
+        if mo is None:
+            continue
+        options = {}
+        while i < len(lines):
+            mo_opt = _rReqOption.match(lines[i])
+            if mo_opt is None or len(lines[i]) - len(lines[i].lstrip()) <= len(mo['indent']):
+                break
+            options[mo_opt['key']] = mo_opt['value'].strip()
+            i += 1
+        if mo['name'] == 'include':
+            # as Sphinx, relative to the document (not to the file including it)
+            arg = mo['arg'].strip()
+            if arg and not arg.startswith('<') and not {'literal', 'code', 'parser'} & set(options):
+                count += _count_generated_ids(env, docname, env.relfn2path(arg, docname)[1], seen)
+            continue
+        if 'reqid' in options:
+            continue
+        if 'csv-file' not in options:
+            count += 1
+            continue
+        # count the rows of the CSV file, if no reqid is given
+        relpath, abspath = env.relfn2path(options['csv-file'], docname)
+        try:
+            with open(abspath, 'rt') as csvfile:
+                spamreader = csv.reader(csvfile, delimiter=',')
+                if 'reqid' not in next(spamreader, ['reqid']):
+                    count += sum(1 for row in spamreader)
+        except OSError:
+            pass
+    return count
+
+def _load_ledger(path):
+    try:
+        with open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'documents': {}}
+    except (OSError, ValueError) as e:
+        raise ConfigError('Cannot read the ID ledger %s: %s' % (path, e))
+
+def _update_ledger(path, docnames, counts):
+    # The document index and the serials given to each document are kept in
+    # the ledger (req_id_ledger) and never given again: a new document gets the
+    # next index and new serials, the other documents keep theirs
+    ledger = _load_ledger(path)
+    documents = ledger.setdefault('documents', {})
+    next_doc = max((x['doc'] for x in documents.values()), default=-1) + 1
+    next_serial = max((s for x in documents.values() for s in x['serials']), default=0) + 1
+    modified = False
+    for docname in docnames:
+        entry = documents.get(docname)
+        if entry is None:
+            entry = documents[docname] = {'doc': next_doc, 'serials': []}
+            next_doc += 1
+            modified = True
+        missing = counts[docname] - len(entry['serials'])
+        if missing > 0:
+            entry['serials'].extend(range(next_serial, next_serial + missing))
+            next_serial += missing
+            modified = True
+    if modified:
+        # the file is replaced at once
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(ledger, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    docindex = { docname: documents[docname]['doc'] for docname in docnames }
+    serials = { docname: documents[docname]['serials'] for docname in docnames if documents[docname]['serials'] }
+    return docindex, serials, next_serial
+
+def env_get_outdated(app, env, added, changed, removed):
+    # Give an index to each document (doc in req_idpattern) and reserve the
+    # serials of its generated IDs, once per build: in the order of the document
+    # names, or as recorded in the ledger. The documents where they changed
+    # must be read again.
+    dom = env.get_domain('req')
+    docnames = sorted(env.found_docs)
+    # only the documents added or changed are scanned again (a change of an
+    # included file or of a CSV file, as dependencies, marks the document changed)
+    known = dom.data['idcounts']
+    counts = { docname: known[docname] if docname in known and docname not in added and docname not in changed
+                        else _count_generated_ids(env, docname)
+               for docname in docnames }
+    dom.data['idcounts'] = counts
+    if env.config.req_id_ledger:
+        docindex, serials, serial = _update_ledger(
+            os.path.join(app.confdir, env.config.req_id_ledger), docnames, counts)
+    else:
+        docindex = { docname: i for i, docname in enumerate(docnames) }
+        serials = {}
+        serial = 1
+        for docname in docnames:
+            if counts[docname]:
+                serials[docname] = range(serial, serial + counts[docname])
+                serial += counts[docname]
+    serial_step = max(docindex.values(), default=0) + 1
+    outdated = [docname
+        for docname, r in serials.items()
+        if docname in env.all_docs and (dom.data['serials'].get(docname) != r
+                                        or dom.data['docindex'].get(docname) != docindex[docname])
+    ]
+    moved = (serial, serial_step) != (dom.data['serial'], dom.data['serial_step'])
+    outdated += [docname
+        for docname in dom.data['overflow']
+        if docname in env.found_docs and (moved or dom.data['docindex'].get(docname) != docindex[docname])
+    ]
+    dom.data['serials'] = serials
+    dom.data['docindex'] = docindex
+    dom.data['serial'] = serial
+    dom.data['serial_step'] = serial_step
+    return outdated
+
 #______________________________________________________________________________
+def env_before_read_docs(app, env, docnames):
+    _read_docnames.clear()
+    _read_docnames.update(docnames)
+    # Sphinx clears each document just before reading it: the generated IDs
+    # moving to another document (new document index) would be found twice
+    env.get_domain('req').clear_docs(_read_docnames)
+    if _profile is not None:
+        _profile.clear()
+
 def doctree_read(app, doctree):
     if _DEBUG:
         print('----------------doctree_read-------------------------')
-    app.env.note_dependency(os.path.join(app.env.srcdir, 'req.html.jinja2'))
-    app.env.note_dependency(os.path.join(app.env.srcdir, 'req.latex.jinja2'))
+    if app.env.docname not in _read_docnames:
+        # the content of a reqlist, parsed by reqlist_node.read_doc
+        return
+    _note_template_dependency(app.env, 'req.html.jinja2')
+    _note_template_dependency(app.env, 'req.latex.jinja2')
+
+    # the documents without any requirement, list or reference are never processed
+    if next(doctree.findall(lambda n: isinstance(n, _REQ_CONTENT)), None) is not None:
+        app.env.get_domain('req').data['reqdocs'].add(app.env.docname)
+
+    # the lists exported to CSV, written once the build is finished
+    exports = [
+        {k: node[k] for k in ('csv-file', 'filter', 'sort', 'fields', 'headers')}
+        for node in doctree.findall(reqlist_node) if 'csv-file' in node.attributes
+    ]
+    if exports:
+        app.env.get_domain('req').data['csvexports'][app.env.docname] = exports
+
+    # the time spent reading this document (possibly in another process)
+    if _profile is not None:
+        app.env.get_domain('req').data['profile'][app.env.docname] = dict(_profile)
+        _profile.clear()
 
 #______________________________________________________________________________
-def env_updated(app, env):
-    if _DEBUG:
-        print('----------------env-updated-------------------------')
-        print('docs: ' + str(env.all_docs.keys()))
-
-    dom = env.get_domain('req')
-
-    # Get a list of defined labels
-    # label -> reqid
-    labels = { req['label']:req['reqid']
-        for name, req, typ, docname, anchor, prio in dom.data['reqs']
-        if req.attributes.get('label', None)
-    }
-
-    # Execute reqlist queries and convert to req attribute
-    for docname in env.all_docs.keys():
+def _link_names(config):
+    # link name -> reverse link name
+    link_name = {}
+    for l, rl in config.req_links.items():
+        link_name[l] = rl
+        link_name[rl] = l
+    return link_name
+
+@_profiled('links')
+def _resolve_links(env, dom):
+    # process all pseudo attributes (from links) and replace with real values
+    # the requirements in the order of the documents
+    reqs = [data[1] for data in sorted(dom.data['reqs'].values(), key=lambda x: x[3])]
+    link_name = _link_names(env.config)
+    # the first link gives the hierarchy used by default
+    up, down = next(iter(env.config.req_links.items()), (None, None))
+    dom.graph = ReqGraph(reqs, dom.data['links'], dom.data['labels'], link_name, up, down)
+    for i, req in enumerate(reqs):
+        for l in link_name:
+            req[l] = dom.graph.linked(i, l)
+    dom.invalidate_queries()
+
+def _fingerprint(entry):
+    # a hash of everything that can be rendered from a requirement
+    name, req, typ, docname, anchor, prio = entry
+    return hashlib.md5(repr((docname, anchor, sorted(req._fields.items()))).encode('utf-8')).hexdigest()
+
+def _output_key(app):
+    # the builders sharing an environment (html and latex with the same doctree
+    # directory) each have their own output to update
+    return (app.builder.name, str(app.outdir))
+
+def _affected_docs(app, env, dom, docnames):
+    # Find the documents that must be processed (and written) again:
+    # the documents read, the ones the builder is going to write and the ones
+    # depending on a requirement that changed since the last output of this builder
+    fingerprints = { reqid: _fingerprint(entry) for reqid, entry in dom.data['reqs'].items() }
+    previous = dom.data['fingerprints'].get(_output_key(app), {})
+    dom.data['fingerprints'][_output_key(app)] = fingerprints
+    changed = set(reqid for reqid in fingerprints.keys() | previous.keys()
+        if fingerprints.get(reqid) != previous.get(reqid))
+
+    if _build_docnames is None or _build_docnames == ['__all__']:
+        # the builder is writing all the documents (-a, singlehtml, latex, etc.)
+        return set(docnames)
+    affected = (set(_build_docnames) | _read_docnames) & set(docnames)
+    if not changed:
+        return affected
+
+    # references can use a label
+    keys = set(changed)
+    changed_reqs = []
+    for reqid in changed:
+        if reqid in dom.data['reqs']:
+            name, req, typ, docname, anchor, prio = dom.data['reqs'][reqid]
+            affected.add(docname)
+            changed_reqs.append(req)
+            if req.get('label'):
+                keys.add(req['label'])
+
+    for docname, deps in dom.data['docdeps'].items():
+        if docname in affected or docname not in env.all_docs:
+            continue
+        if deps['reqids'] & keys:
+            affected.add(docname)
+            continue
+        # a requirement may now be selected by a reqlist
+        for req_filter in deps['filters']:
+            try:
+                # a change anywhere can change the result of the graph functions
+                selected = _uses_graph(req_filter) or _filter_and_sort(changed_reqs, req_filter, graph=dom.graph)
+            except Exception:
+                selected = True
+            if selected:
+                affected.add(docname)
+                break
+    return affected
+
+class _PickledDoctreeCache(dict):
+    # env._pickled_doctree_cache, where the documents processed in env_updated
+    # are pickled the first time they are needed (by env.get_doctree)
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.pending = {}
+
+    def __missing__(self, docname):
+        doctree = self.pending.pop(docname, None)
+        if doctree is None:
+            raise KeyError(docname)
+        with _timed('pickle'):
+            s = self[docname] = pickle.dumps(doctree, pickle.HIGHEST_PROTOCOL)
+        return s
+
+@_profiled('process')
+def _process_doc(app, env, dom, docname, doctree=None):
+    # Resolve in a document all what depends on the other documents
+    # (reqlist, links, references) and record those dependencies
+    if doctree is None:
         # inspired by Environment.get_and_resolve_doctree
         try:
             doctree = env._write_doc_doctree_cache[docname]
@@ -639,228 +1697,272 @@ def env_updated(app, env):
         except KeyError:
             doctree = env.get_doctree(docname)
             env._write_doc_doctree_cache[docname] = doctree
-
-        for node in doctree.traverse(reqlist_node):
-            node.fill(dom, app, doctree, docname)
-
-    # process all pseudo attributes (from links) and replace with real values (ReqReference)
-    # step 1 - fill attribute values
-    # links = {reqid -> {link -> set(ids)}
-    links = {}
-    link_name = {}
-    for l, rl in env.config.req_links.items():
-        link_name[l] = rl
-        link_name[rl] = l
-    for docname in env.all_docs.keys():
-        doctree = env._write_doc_doctree_cache[docname]
-        for node in doctree.traverse(req_node):
-            for l in link_name:
-                for x in node.get(l, []):
-                    # if a label, we need to translate
-                    if x in labels:
-                        x = labels[x]
-                    links.setdefault(x, dict()).setdefault(link_name[l], set()).add( node['reqid'] )
-                links.setdefault(node['reqid'], dict()).setdefault(l, set()).update( [labels.get(x, x) for x in node.get(l, () )] )
-    # apply
-    for docname in env.all_docs.keys():
-        doctree = env._write_doc_doctree_cache[docname]
-        for node in doctree.traverse(req_node):
-            for l in link_name:
-                node[l] = list(links[node['reqid']][l])
-
-    # step 2 - do the replacement
-    reqrefs_just_added = set()
-    for docname in env.all_docs.keys():
-        doctree = env._write_doc_doctree_cache[docname]
-        if _DEBUG:
-            print('Removing req_links_node from ' + docname)
-        for node in doctree.traverse(req_links_node):
-            # get the req from the domain data
-            p  = nodes.inline(text='')
-            match = [req
-                for name, req, typ, docname, anchor, prio in dom.data['reqs']
-                if req['reqid']==node['reqid']
-            ]
-            if match and match[0].get(node['link']):
-                # build a list of ReqReference
-                for r in match[0].get(node['link']):
-                    n = ReqReference('', '', internal=True)
-                    reqrefs_just_added.add(n)
-                    n['reftarget'] = r
-                    n['refdoc'] = docname
-                    targetid = dom.add_reqref(n, n['reftarget'], n['refdoc'])
-                    targetnode = nodes.target('', '', ids=[targetid])
-                    n['ids'].append(targetid)
-                    n.children = targetnode + n.children
-
-                    n.append( nodes.literal(text=r, classes=['xref', 'req', 'req-req']) )
-
-                    p += n
-                    p += nodes.inline(text=', ')
-                if p.children:
-                    p.pop()
-            if not p.children:
-                p  = nodes.inline(text='\u202F')
-            node.replace_self(p)
+    _processed_docnames.add(docname)
+
+    # forget what was done when this document was processed in a previous build
+    dom.clear_reqrefs(docname)
+    labels = dom.data['labels']
+    deps = dict(reqids=set(), reqrefs=set(), filters=[])
+
+    # Walk the document once, indexing the nodes by type (in the document order).
+    # Execute reqlist queries and convert to req attribute, their content is then
+    # walked as the rest of the document
+    found = {req_node: [], req_links_node: [], ReqReference: [], ReqRefReference: []}
+    # the ids of the tables do not depend on the other documents processed,
+    # and are unique once the documents are merged (singlehtml, etc.)
+    table_serial = 0
+    def new_table_id():
+        nonlocal table_serial
+        table_serial += 1
+        return 'reqlist-%s-%d' % (_docname_hash(docname), table_serial)
+    def _walk(parent):
+        for node in parent.children:
+            cls = type(node)
+            if cls is reqlist_node:
+                reqs = node.fill(dom, app, doctree, docname, new_table_id)
+                deps['reqids'].update(r['reqid'] for r in reqs)
+                deps['filters'].append(node['filter'])
+            elif cls in found:
+                found[cls].append(node)
+            if node.children:
+                _walk(node)
+    _walk(doctree)
+
+    # links have been resolved on the requirements of the domain
+    link_name = _link_names(env.config)
+    for node in found[req_node]:
+        req = dom.data['reqs'][node['reqid']][1]
+        for l in link_name:
+            node[l] = req[l]
+
+    # replace the pseudo attributes (from links) with ReqReference
+    reqrefs_just_added = []
+    if _DEBUG:
+        print('Removing req_links_node from ' + docname)
+    for node in found[req_links_node]:
+        # get the req from the domain data
+        p  = nodes.inline(text='')
+        match = dom.data['reqs'].get(node['reqid'])
+        if match and match[1].get(node['link']):
+            # build a list of ReqReference
+            for r in match[1].get(node['link']):
+                n = ReqReference('', '', internal=True)
+                reqrefs_just_added.append(n)
+                n['reftarget'] = r
+                n['refdoc'] = docname
+                targetid = dom.add_reqref(n, n['reftarget'], n['refdoc'])
+                targetnode = nodes.target('', '', ids=[targetid])
+                n['ids'].append(targetid)
+                n.children = targetnode + n.children
+
+                n.append( nodes.literal(text=r, classes=['xref', 'req', 'req-req']) )
+
+                p += n
+                p += nodes.inline(text=', ')
+            if p.children:
+                p.pop()
+        if not p.children:
+            p  = nodes.inline(text=' ')
+        node.replace_self(p)
 
     # Do not use label in ReqReference, replace with reqid
-    for docname in env.all_docs.keys():
-        doctree = env._write_doc_doctree_cache[docname]
-        for node in doctree.traverse(ReqReference):
-            # get the target req from the domain data
-            match = [
-                (docname, anchor, req)
-                for name, req, typ, docname, anchor, prio in dom.data['reqs']
-                if req.attributes.get('label', 'LABEL_UNDEF') == node['reftarget']
-            ]
-            if len(match) > 0:
-                node['reftarget'] = match[0][2]['reqid']
-                if node.children:
-                    node.children[0].children[0] = nodes.Text(match[0][2]['reqid'])
+    for node in found[ReqReference] + reqrefs_just_added:
+        # get the target req from the domain data
+        reqid = labels.get(node['reftarget'])
+        if reqid is not None:
+            node['reftarget'] = reqid
+            if node.children:
+                node.children[0].children[0] = nodes.Text(reqid)
 
     # Apply pattern for text of reference
-    for docname in env.all_docs.keys():
-        doctree = env._write_doc_doctree_cache[docname]
-        for node in doctree.traverse(ReqReference):
-            # get the target req from the domain data
-            match = [
-                (docname, anchor, req)
-                for name, req, typ, docname, anchor, prio in dom.data['reqs']
-                if req['reqid'] == node['reftarget']
-            ]
-            if len(match) > 0:
-                req = match[0][2]
-                if node.children:
-                    s = app.config.req_reference_pattern.format(**req.attributes)
-                    node.children[0].children[0] = nodes.Text(s)
+    for node in found[ReqReference] + reqrefs_just_added:
+        deps['reqids'].add(node['reftarget'])
+        # get the target req from the domain data
+        match = dom.data['reqs'].get(node['reftarget'])
+        if match:
+            req = match[1]
+            if node.children:
+                s = app.config.req_reference_pattern.format(**req)
+                node.children[0].children[0] = nodes.Text(s)
 
     # Do not use label in ReqRefReference
-    for docname in env.all_docs.keys():
-        doctree = env._write_doc_doctree_cache[docname]
-        for node in doctree.traverse(ReqRefReference):
-            match = [
-                (docname, anchor, req)
-                for name, req, typ, docname, anchor, prio in dom.data['reqs']
-                if req.attributes.get('label', 'LABEL_UNDEF') == node['reftarget']
-            ]
-            if len(match) > 0:
-                node['reftarget'] = match[0][2]['reqid']
+    for node in found[ReqRefReference]:
+        reqid = labels.get(node['reftarget'])
+        if reqid is not None:
+            node['reftarget'] = reqid
+        deps['reqids'].add(node['reftarget'])
+        deps['reqrefs'].add(node['reftarget'])
 
     # Add a target node for all ReqReference
-    for docname in env.all_docs.keys():
-        doctree = env._write_doc_doctree_cache[docname]
-
-        for node in doctree.traverse(ReqReference):
-            # we process only the ReqReference added by Sphinx after parsing a rst
-            # and not the nodes added after replacing a pseudo attribute
-            if node in reqrefs_just_added:
-                continue
-            # populate its attributes so that it can be a target itself
-            # and record in the domain this node
-            targetid = dom.add_reqref(node, node['reftarget'], node['refdoc'])
-            targetnode = nodes.target('', '', ids=[targetid])
-            node['ids'].append(targetid)
-            node.children = targetnode + node.children
-
-            # refuri will be set in doctree-resolved, once we have identified
-            # all the nodes
-
-    # since we will reexecute queries in doctree_resolved
-    # we don't want to keep old ReqReference in domain
-    # let's reinit completely the list
-    dom.data['reqrefs'] = []
-    for docname in env.all_docs.keys():
-        doctree = env._write_doc_doctree_cache[docname]
-
-        for reqref in doctree.traverse(ReqReference):
-            name = reqref['targetid']
-            dom.data['reqrefs'].append((
-                name,
-                reqref,
-                'reqref',
-                docname,
-                name,
-                1,
-            ))
+    # we process only the ReqReference added by Sphinx after parsing a rst
+    # and not the nodes added after replacing a pseudo attribute
+    for node in found[ReqReference]:
+        # populate its attributes so that it can be a target itself
+        # and record in the domain this node
+        targetid = dom.add_reqref(node, node['reftarget'], node['refdoc'])
+        targetnode = nodes.target('', '', ids=[targetid])
+        node['ids'].append(targetid)
+        node.children = targetnode + node.children
+
+        # refuri will be set in doctree-resolved, once we have identified
+        # all the nodes
+
+    dom.data['docdeps'][docname] = deps
 
     # update pickled doctree (Latex builder is starting from the cache of pickled doctree)
-    # we need to update env._pickled_doctree_cache[docname]
+    # we need to update env._pickled_doctree_cache[docname], only if asked for
     # do not save in a file, content would not be purged correctly when read again
-    for docname in env.all_docs.keys():
-        doctree = env._write_doc_doctree_cache[docname]
-        s = pickle.dumps(doctree, pickle.HIGHEST_PROTOCOL)
-        env._pickled_doctree_cache[docname] = s
-        
-    # make sure that all doc are rewritten
-    return list(env.all_docs.keys())
+    cache = env._pickled_doctree_cache
+    if not isinstance(cache, _PickledDoctreeCache):
+        cache = env._pickled_doctree_cache = _PickledDoctreeCache(cache)
+    cache.pop(docname, None)
+    cache.pending[docname] = doctree
+
+@_profiled('references')
+def _reqref_index(dom):
+    # reftarget -> list of (docname, targetid) of the ReqReference pointing to it,
+    # used to render :req:ref:
+    reqref_targets = {}
+    for target, entries in dom.data['reqrefs'].items():
+        # keep the same order than a complete build
+        entries.sort(key=lambda x: x[3])
+        reqref_targets[target] = [(x[3], x[0]) for x in entries]
+    return reqref_targets
+
+def _changed_reqref_targets(app, dom):
+    # the targets for which the list of ReqReference changed since the last
+    # output of this builder (the :req:ref: pointing to them must be rendered again)
+    reqref_targets = _reqref_index(dom)
+    previous = dom.data['written_reqrefs'].get(_output_key(app), {})
+    dom.data['reqref_targets'] = dom.data['written_reqrefs'][_output_key(app)] = reqref_targets
+    return set(target for target in reqref_targets.keys() | previous.keys()
+        if reqref_targets.get(target) != previous.get(target))
 
 #______________________________________________________________________________
+def env_updated(app, env):
+    if _DEBUG:
+        print('----------------env-updated-------------------------')
+        print('docs: ' + str(env.all_docs.keys()))
+
+    dom = env.get_domain('req')
+
+    # always process the documents in the same order, whatever the order
+    # they were read in
+    docnames = sorted(env.all_docs)
+    _processed_docnames.clear()
+
+    _resolve_links(env, dom)
+    _prune_csv_cache(env, dom)
+
+    # process only the documents depending on what changed
+    # (and with something to process)
+    for docname in sorted(_affected_docs(app, env, dom, docnames) & dom.data['reqdocs']):
+        _process_doc(app, env, dom, docname)
+
+    # and the documents listing references to a requirement, if this list changed
+    targets = _changed_reqref_targets(app, dom)
+    reprocessed = False
+    for docname in docnames:
+        deps = dom.data['docdeps'].get(docname)
+        if docname not in _processed_docnames and deps and deps['reqrefs'] & targets:
+            _process_doc(app, env, dom, docname)
+            reprocessed = True
+    if reprocessed:
+        # final index of the references, shared by all the documents written
+        dom.data['reqref_targets'] = dom.data['written_reqrefs'][_output_key(app)] = _reqref_index(dom)
+
+    if app.builder.format in ('html', 'latex'):
+        _export_csv(app, dom)
+
+    # make sure that all these docs are rewritten
+    return sorted(_processed_docnames)
+
+#______________________________________________________________________________
+class ReqProcessTransform(SphinxPostTransform):
+    # A document written again by Sphinx after env_updated (section numbers
+    # changed, etc.) is processed before its references are resolved
+    default_priority = 5
+
+    def run(self, **kwargs):
+        dom = self.env.get_domain('req')
+        if self.env.docname not in _processed_docnames and self.env.docname in dom.data['docdeps']:
+            _process_doc(self.app, self.env, dom, self.env.docname, self.document)
+
+@_profiled('resolved')
 def doctree_resolved(app, doctree, fromdocname):
     if _DEBUG:
         print('----------------doctree_resolved--%s-----------------------' % fromdocname)
     dom = app.env.get_domain('req')
 
+    found = {ReqReference: [], ReqRefReference: []}
+    for node in doctree.findall(lambda n: type(n) in found):
+        found[type(node)].append(node)
+
     # Now that we have the complete list of requirements (i.e. all source files
     # have been read and all directives executed), we can transform the ReqReference
     # to point to the req_node object
-    for node in doctree.traverse(ReqReference):
+    for node in found[ReqReference]:
         if 'refuri' in node:
             continue
         # get the target req from the domain data
-        match = [
-            (docname, anchor, req)
-            for name, req, typ, docname, anchor, prio in dom.data['reqs']
-            if req['reqid'] == node['reftarget']
-        ]
-        if len(match) > 0:
-            todocname = match[0][0]
-            targ = match[0][1]
+        match = dom.data['reqs'].get(node['reftarget'])
+        if match:
+            todocname = match[3]
+            targ = match[4]
             node['refuri'] = get_refuri(app.builder, fromdocname, todocname, targ)
 
     # We have now the complete list of ReqReference (references pointing to a requirement)
     # We can transform the ReqRefReference
     # to point to the ReqReference object
-    for node in doctree.traverse(ReqRefReference):
+    for node in found[ReqRefReference]:
         # node['refid'] = node['reftarget']
         # Get all ReqReference nodes, and add a reference to them
-        match = [
-            (docname, anchor, reqref)
-            for name, reqref, typ, docname, anchor, prio in dom.data['reqrefs']
-            if reqref['reftarget'] == node['reftarget']
-        ]
+        match = dom.data['reqref_targets'].get(node['reftarget'], [])
+        if app.config.req_reference_collapse:
+            # only the first reference of each document
+            match = list({ docname: (docname, targetid) for docname, targetid in reversed(match) }.values())[::-1]
+        more = 0
+        if 0 < app.config.req_reference_max < len(match):
+            more = len(match) - app.config.req_reference_max
+            match = match[:app.config.req_reference_max]
         p  = nodes.inline()
-        for r in match:
+        for docname, targetid in match:
             if _DEBUG:
-                print("Adding a reference to ReqReference ",node['refdoc'], r[2]['refdoc'], r[1])
+                print("Adding a reference to ReqReference ",node['refdoc'], docname, targetid)
             n = nodes.reference('', '', internal=True)
-            n['refuri'] = get_refuri(app.builder, node['refdoc'], r[2]['refdoc'], r[1])
+            n['refuri'] = get_refuri(app.builder, node['refdoc'], docname, targetid)
             n.append( nodes.inline(text=app.config.req_reference_text) )
             p += n
+        if more:
+            p += nodes.inline(text=' (+%d)' % more)
 
         node.replace_self(p)
-    for node in doctree.traverse(ReqRefReference):
-        print('**** ERROR')
+    if _DEBUG:
+        for node in doctree.traverse(ReqRefReference):
+            print('**** ERROR')
+
+    # the processed doctree is now written (and resolved), no need to keep it for env.get_doctree
+    pending = getattr(app.env._pickled_doctree_cache, 'pending', {})
+    if pending.get(fromdocname) is doctree:
+        del pending[fromdocname]
 
 #______________________________________________________________________________
 def config_inited(app, config):
     if _DEBUG:
         print('----------------config_inited-----------------------')
 
-    # Define roles & HTML styles
-    if not config.rst_prolog:
-        config.rst_prolog = ''
-    config.rst_prolog = '''
-
-.. role:: reqid
-
-.. role:: title
+    # New build: the templates may have changed
+    _renderers.clear()
+    _get_inline_template.cache_clear()
+    # and the text depends on the configuration (rst_prolog, roles, etc.)
+    global _text_writer, _config_hash
+    _text_cache.clear()
+    _text_writer = None
+    _config_hash = None
 
-.. raw:: html
-
-    <style>
-    ''' + textwrap.indent(config.req_html_css, '        ') + '''
-    </style>
-    ''' + config.rst_prolog
+    global _profile, _profile_start
+    _profile = {} if config.req_profile else None
+    _profile_start = time.perf_counter()
 
     # Define LaTeX preamble for envs and styles
     config.latex_elements.setdefault('preamble', '')
@@ -875,6 +1977,253 @@ def config_inited(app, config):
         ReqDirective.option_spec[l] = link
         ReqDirective.option_spec[rl] = link
 
+def _wrap_build(builder):
+    # Record the documents given to Builder.build (None for all of them, -a):
+    # env_updated processes the documents the builder is going to write
+    build = builder.build
+    @functools.wraps(build)
+    def _build(docnames, *args, **kwargs):
+        global _build_docnames
+        _build_docnames = docnames
+        return build(docnames, *args, **kwargs)
+    builder.build = _build
+
+def _worker_profile_dir(app):
+    return os.path.join(app.doctreedir, 'req-profile')
+
+def _wrap_write_doc(app):
+    # Under -j N, the documents are translated by child processes (forked
+    # from the main one, with its timings): each one saves its own timings,
+    # collected by _write_profile
+    builder = app.builder
+    write_doc = builder.write_doc
+    main_pid = os.getpid()
+    worker_pid = main_pid
+    @functools.wraps(write_doc)
+    def _write_doc(docname, doctree):
+        nonlocal worker_pid
+        if os.getpid() == main_pid:
+            return write_doc(docname, doctree)
+        if worker_pid != os.getpid():
+            worker_pid = os.getpid()
+            _profile.clear()
+            _peaks.clear()
+        write_doc(docname, doctree)
+        dirname = _worker_profile_dir(app)
+        os.makedirs(dirname, exist_ok=True)
+        with open(os.path.join(dirname, '%d.json' % worker_pid), 'wt') as f:
+            json.dump(_profile, f)
+    builder.write_doc = _write_doc
+    shutil.rmtree(_worker_profile_dir(app), ignore_errors=True)
+
+def builder_inited(app):
+    _wrap_build(app.builder)
+    if _profile is not None:
+        _wrap_write_doc(app)
+    # The HTML styles, a static file written before the pages (its checksum is
+    # added to the links) and only when it changed
+    if app.builder.format != 'html':
+        return
+    # the epub builders package only the files of a known media type
+    media_types = getattr(app.builder, 'media_types', None)
+    if media_types is not None and '.csv' not in media_types:
+        app.builder.media_types = dict(media_types, **{'.csv': 'text/csv'})
+    fn = os.path.join(app.builder.outdir, '_static', 'req.css')
+    try:
+        with open(fn, 'rt', encoding='utf-8') as f:
+            current = f.read()
+    except OSError:
+        current = None
+    if current != app.config.req_html_css:
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        with open(fn, 'wt', encoding='utf-8') as f:
+            f.write(app.config.req_html_css)
+    app.add_css_file('req.css')
+
+#______________________________________________________________________________
+def _write_csv(fn, reqs, fields, headers):
+    dirname = os.path.dirname(fn)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    with open(fn, 'wt') as csvfile:
+        wr = csv.writer(csvfile, delimiter=',')
+        wr.writerow(headers)
+        for r in reqs:
+            wr.writerow([r.get(x, '') for x in fields])
+
+@_profiled('csv-export')
+def _export_csv(app, dom):
+    # Export the reqlist to CSV, in the main process once all the documents
+    # are processed (whatever the number of writing processes), before the
+    # builder writes them: the files are then part of the output (epub).
+    # Only the lists of the documents processed during this build are exported
+    # again, the others did not change.
+    exports = {}
+    outdated = set()
+    for docname in sorted(dom.data['csvexports']):
+        for export in dom.data['csvexports'][docname]:
+            fn = os.path.join(app.builder.outdir, export['csv-file'])
+            # the same file can be exported several times, the last one wins
+            exports[fn] = export
+            if docname in _processed_docnames or not os.path.exists(fn):
+                outdated.add(fn)
+    for fn in sorted(outdated):
+        export = exports[fn]
+        reqs = dom.query(export['filter'], export['sort'])
+        _write_csv(fn, reqs, export['fields'], export['headers'])
+
+def _write_profile(app, dom):
+    # JSON report in the output directory and summary in the log
+    phases = {}
+    documents = {}
+    profiles = []
+    for docname in sorted(_read_docnames):
+        profile = dom.data['profile'].get(docname, {})
+        documents[docname] = round(sum(x[1] for phase, x in profile.items() if phase == 'directive'), 6)
+        profiles.append(profile)
+    profiles.append(_profile)
+    # the writing processes, see _wrap_write_doc
+    dirname = _worker_profile_dir(app)
+    for fn in sorted(os.listdir(dirname)) if os.path.isdir(dirname) else ():
+        with open(os.path.join(dirname, fn), 'rt') as f:
+            profiles.append(json.load(f))
+    shutil.rmtree(dirname, ignore_errors=True)
+    for profile in profiles:
+        for phase, (n, t, peak) in profile.items():
+            entry = phases.setdefault(phase, [0, 0.0, 0])
+            entry[0] += n
+            entry[1] += t
+            entry[2] = max(entry[2], peak)
+    def _phase(n, t, peak):
+        # the peak only when the allocations are traced
+        return dict(count=n, time=round(t, 6), **({'peak': peak} if peak else {}))
+    report = {
+        'builder': app.builder.name,
+        'parallel': app.parallel,
+        'time': round(time.perf_counter() - _profile_start, 6),
+        'phases': { phase: _phase(*entry) for phase, entry in sorted(phases.items()) },
+        'counters': {
+            'documents': len(app.env.all_docs),
+            'documents_read': len(_read_docnames),
+            'documents_processed': len(_processed_docnames),
+            'requirements': len(dom.data['reqs']),
+            'references': sum(len(x) for x in dom.data['docrefs'].values()),
+            'reqlists': sum(len(x['filters']) for x in dom.data['docdeps'].values()),
+        },
+        # time spent in the directives of each document read
+        'documents': documents,
+    }
+    fn = os.path.join(app.builder.outdir, 'req-profile.json')
+    os.makedirs(app.builder.outdir, exist_ok=True)
+    with open(fn, 'wt') as f:
+        json.dump(report, f, indent=2)
+
+    logger.info('requirements profile (%s):', fn)
+    for phase, entry in report['phases'].items():
+        logger.info('    %-12s %8d %10.3f s%s', phase, entry['count'], entry['time'],
+                    ' %10.1f MB' % (entry['peak'] / 2**20) if 'peak' in entry else '')
+    logger.info('    %s', ', '.join('%s: %d' % x for x in report['counters'].items()))
+
+def build_finished(app, exception):
+    if exception is not None:
+        return
+    if _profile is not None:
+        _write_profile(app, app.env.get_domain('req'))
+
+#______________________________________________________________________________
+_EXPORT_FORMATS = ('csv', 'json', 'jsonl')
+
+def _export_fields(config):
+    # all the fields of a requirement, except the pseudo attributes of the links
+    fields = ['reqid', 'label', 'title', 'content', 'comment', 'text_title', 'text_content']
+    fields += [k for k in config.req_options if k not in fields]
+    for l, rl in config.req_links.items():
+        fields += [l, rl]
+    fields.append('docname')
+    return fields
+
+class ReqExportBuilder(Builder):
+    """
+    Export all the requirements, with their links resolved, in a single file
+    (``requirements.csv``, ``requirements.json`` or ``requirements.jsonl``)
+    without writing the documents.
+    """
+
+    name = 'reqexport'
+    format = 'reqexport'
+    epilog = 'The requirements are exported in %(outdir)s.'
+
+    def init(self):
+        if self.config.req_export_format not in _EXPORT_FORMATS:
+            raise ConfigError('req_export_format: unknown format %r (expected one of %s)' % (
+                self.config.req_export_format, ', '.join(_EXPORT_FORMATS)))
+
+    def get_outdated_docs(self):
+        # no document to write
+        return []
+
+    def get_target_uri(self, docname, typ=None):
+        return ''
+
+    def prepare_writing(self, docnames):
+        return
+
+    def write_doc(self, docname, doctree):
+        return
+
+    def write_documents(self, docnames):
+        # the documents are not resolved nor written
+        return
+
+    if not hasattr(Builder, 'write_documents'):
+        # Sphinx < 8.1
+        def write(self, *ignored):
+            return
+
+    @_profiled('export')
+    def finish(self):
+        dom = self.env.get_domain('req')
+        fmt = self.config.req_export_format
+        fields = self.config.req_export_fields or _export_fields(self.config)
+        link_names = _link_names(self.config)
+        reqs = dom.query(self.config.req_export_filter, self.config.req_export_sort)
+
+        def records():
+            for req in reqs:
+                record = {}
+                for f in fields:
+                    if f == 'docname':
+                        v = req._docname
+                    else:
+                        v = req.get(f)
+                    if f in link_names and v is not None and fmt == 'csv':
+                        # as imported by req:req (csv-file)
+                        v = ','.join(v)
+                    record[f] = v
+                yield record
+
+        os.makedirs(self.outdir, exist_ok=True)
+        fn = os.path.join(self.outdir, 'requirements.' + fmt)
+        # the file is replaced at once, it can be read at any time
+        tmp = '%s.%d.tmp' % (fn, os.getpid())
+        with open(tmp, 'wt', encoding='utf-8', newline='' if fmt == 'csv' else None) as f:
+            if fmt == 'csv':
+                wr = csv.writer(f, delimiter=',')
+                wr.writerow(fields)
+                for record in records():
+                    wr.writerow(['' if v is None else v for v in record.values()])
+            elif fmt == 'json':
+                f.write('[')
+                sep = '\n'
+                for record in records():
+                    f.write(sep + json.dumps(record, ensure_ascii=False, default=str))
+                    sep = ',\n'
+                f.write('\n]\n')
+            else:
+                for record in records():
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        os.replace(tmp, fn)
+
 #______________________________________________________________________________
 def setup(app: Sphinx) -> ExtensionMetadata:
     # config: req_html_style, req_latex_preamble
@@ -892,20 +2241,38 @@ def setup(app: Sphinx) -> ExtensionMetadata:
     else:
         with open(os.path.join(os.path.dirname(__file__), 'req.css'), 'r') as f:
             html_css_default = f.read()
-    app.add_config_value('req_html_css', html_css_default, 'env', [str]) # HTML stylesheet
+    app.add_config_value('req_html_css', html_css_default, 'html', [str]) # HTML stylesheet, written in _static/req.css
 
     app.add_config_value('req_reference_text', u'\u2750', 'env', [str]) # Character or string used for cross references
     app.add_config_value('req_options', {}, 'env', [dict]) # Additional options/fields that can be defined on requirements
     app.add_config_value('req_links', {}, 'env', [dict]) # Additional links between requirements
     app.add_config_value('req_idpattern', 'REQ-{doc:02}{doc_serial:03d}', 'env', [str]) # Additional options/fields that can be defined on requirements
+    app.add_config_value('req_id_ledger', '', 'env', [str]) # JSON file keeping the doc and serials of the generated IDs
     app.add_config_value('req_reference_pattern', '{reqid}', 'env', [str]) # pattern of text inserted when a reference is
+    app.add_config_value('req_reference_max', 0, 'env', [int]) # maximum number of links inserted by :req:ref: (0: no limit)
+    app.add_config_value('req_reference_collapse', False, 'env', [bool]) # only one link per document for :req:ref:
+    app.add_config_value('req_profile', False, '', [bool]) # timings of the extension, in req-profile.json
+    app.add_config_value('req_export_format', 'json', '', [str]) # reqexport builder: csv, json or jsonl
+    app.add_config_value('req_export_fields', [], '', [list]) # reqexport builder: fields exported (default: all)
+    app.add_config_value('req_export_filter', None, '', [str]) # reqexport builder: filter of the requirements
+    app.add_config_value('req_export_sort', None, '', [str]) # reqexport builder: sort of the requirements
 
     app.connect('config-inited', config_inited)
+    app.connect('builder-inited', builder_inited)
+    app.connect('env-get-outdated', env_get_outdated)
+    app.connect('env-before-read-docs', env_before_read_docs)
     app.connect('doctree-read', doctree_read)
     app.connect('env-updated', env_updated)
     app.connect('doctree-resolved', doctree_resolved)
+    app.connect('build-finished', build_finished)
+
+    # the roles used by req.rst.jinja2 (styled by req.css and req.preamble)
+    for name in ('reqid', 'title'):
+        app.add_role(name, roles.CustomRole(name, roles.generic_custom_role, {'class': [name]}))
 
     app.add_domain(ReqDomain)
+    app.add_builder(ReqExportBuilder)
+    app.add_post_transform(ReqProcessTransform)
     app.add_node(req_node,
                  html= (html_visit_req_node, depart_req_node),
                  latex=(latex_visit_req_node, depart_req_node)
@@ -916,5 +2283,7 @@ def setup(app: Sphinx) -> ExtensionMetadata:
                  )
 
     return {
-        'version': '0.1'
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
     }
\ No newline at end of file
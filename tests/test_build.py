@@ -0,0 +1,331 @@
+
+import io
+import os
+import json
+import re
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from sphinx.application import Sphinx
+from sphinx.util.docutils import docutils_namespace, patch_docutils
+
+from sphinxcontrib.requirement import req
+
+#_______________________________________________________________________________
+class BuildTestCase(unittest.TestCase):
+    # a small project built with Sphinx in a temporary directory
+
+    conf = "extensions = ['sphinxcontrib.requirement']\n"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmp.name, 'src')
+        self.write('conf.py', self.conf)
+        self.write('index.rst', 'Index\n=====\n\n.. toctree::\n    :glob:\n\n    doc*\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, fn, s):
+        path = os.path.join(self.src, fn)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(s)
+
+    def build(self, builder='html', out='out', fresh=False, parallel=0, force_all=False, doctrees=None):
+        outdir = os.path.join(self.tmp.name, out)
+        doctreedir = os.path.join(self.tmp.name, (doctrees or out) + '.doctrees')
+        warning = io.StringIO()
+        with patch_docutils(self.src), docutils_namespace():
+            app = Sphinx(self.src, self.src, outdir, doctreedir, builder,
+                         status=None, warning=warning, freshenv=fresh, parallel=parallel)
+            app.build(force_all)
+        assert app.statuscode == 0, warning.getvalue()
+        return app
+
+    def read(self, out, fn):
+        with open(os.path.join(self.tmp.name, out, fn), encoding='utf-8') as f:
+            return f.read()
+
+#_______________________________________________________________________________
+class TestSerial(BuildTestCase):
+
+    conf = BuildTestCase.conf + "req_idpattern = 'R-{serial:04d}'\n"
+
+    def setUp(self):
+        super().setUp()
+        self.write('inc.txt', ''.join('.. req:req:: Included %d\n\n    x\n\n' % i for i in range(5)))
+        for d in range(20):
+            s = 'Doc %d\n=======\n\n' % d + ''.join('.. req:req:: R %d\n\n    x\n\n' % i for i in range(5))
+            if d % 3 == 0:
+                s += '.. include:: inc.txt\n'
+            self.write('doc%02d.rst' % d, s)
+
+    def ids(self, out):
+        return sorted(set(re.findall(r'R-\d{4}', ''.join(self.read(out, 'doc%02d.html' % d) for d in range(20)))))
+
+    def test_parallel(self):
+        # the included requirements are counted: the same IDs as a serial build
+        self.build(parallel=4)
+        self.build(out='serial')
+        assert self.ids('out') == self.ids('serial')
+        assert len(self.ids('out')) == 135
+
+    def test_rescan(self):
+        # only the documents changed, or including a changed file, are scanned again
+        self.build()
+        scanned = []
+        count = req._count_generated_ids
+        def _count(env, docname, path=None, seen=None):
+            if path is None:
+                scanned.append(docname)
+            return count(env, docname, path, seen)
+        with mock.patch.object(req, '_count_generated_ids', _count):
+            self.build()
+            assert scanned == []
+            with open(os.path.join(self.src, 'inc.txt'), 'a') as f:
+                f.write('.. req:req:: Included 5\n\n    x\n\n')
+            self.build()
+        assert sorted(scanned) == ['doc%02d' % d for d in range(0, 20, 3)]
+        self.build(out='fresh', fresh=True)
+        assert self.ids('out') == self.ids('fresh')
+        assert len(self.ids('out')) == 142
+
+#_______________________________________________________________________________
+class TestProfile(BuildTestCase):
+
+    conf = BuildTestCase.conf + "req_profile = True\n"
+
+    def setUp(self):
+        super().setUp()
+        for d in range(12):
+            self.write('doc%02d.rst' % d, 'Doc %d\n=======\n\n' % d + '.. req:req:: R\n\n    x\n\n' * 2)
+
+    def phases(self, out):
+        return json.loads(self.read(out, 'req-profile.json'))['phases']
+
+    def test_parallel(self):
+        # the timings of the processes writing the documents are included
+        self.build(parallel=4)
+        assert self.phases('out')['translate']['count'] == 24
+        assert not os.path.exists(os.path.join(self.tmp.name, 'out.doctrees', 'req-profile'))
+
+#_______________________________________________________________________________
+class TestTargets(BuildTestCase):
+
+    def test_singlehtml(self):
+        # the targets of the references are unique once the documents are merged
+        self.write('doc1.rst', 'Doc 1\n=====\n\n.. req:req:: R1\n    :reqid: REQ-1\n\n    x\n\nSee :req:req:`REQ-1`\n')
+        self.write('doc2.rst', 'Doc 2\n=====\n\nSee :req:req:`REQ-1`\n\n:req:ref:`REQ-1`\n')
+        self.build('singlehtml')
+        ids = re.findall(r'id="(REQ-1-[^"]*)"', self.read('out', 'index.html'))
+        assert len(ids) == 2
+        assert len(set(ids)) == len(ids)
+
+#_______________________________________________________________________________
+class TestFields(BuildTestCase):
+
+    def test_undefined(self):
+        # the fields not defined on a requirement are empty cells, as in the template
+        self.write('doc1.rst', 'Doc 1\n=====\n\n.. req:req:: R1\n    :reqid: REQ-1\n\n    x\n\n'
+                               '.. req:reqlist:: All\n    :fields: reqid, label, links, docname\n'
+                               '    :headers: ID, Label, Links, Document\n    :widths: 40 20 20 20\n\n')
+        self.build()
+        cells = re.findall(r'<td><p>(.*?)</p></td>|<td></td>', self.read('out', 'doc1.html'))
+        assert cells == ['REQ-1', '', '', '']
+
+#_______________________________________________________________________________
+class TestExport(BuildTestCase):
+
+    def test_no_table(self):
+        # the lists are not rendered by the reqexport builder
+        self.write('doc1.rst', 'Doc 1\n=====\n\n.. req:req:: R1\n    :reqid: REQ-1\n\n    x\n\n'
+                               '.. req:reqlist:: All\n\n.. req:reqlist:: Template\n\n    {{reqs|length}}\n')
+        with mock.patch.object(req.reqlist_node, 'build_table', side_effect=AssertionError), \
+             mock.patch.object(req.reqlist_node, 'read_doc', side_effect=AssertionError):
+            self.build('reqexport')
+        assert [r['reqid'] for r in json.loads(self.read('out', 'requirements.json'))] == ['REQ-1']
+
+#_______________________________________________________________________________
+class TestIncremental(BuildTestCase):
+    # an incremental build gives the same output as a fresh one
+
+    conf = BuildTestCase.conf + "req_links = {'parents': 'children'}\n"
+
+    def setUp(self):
+        super().setUp()
+        self.write('doc1.rst', 'Doc 1\n=====\n\n'
+                               '.. req:req:: R1\n    :reqid: REQ-1\n\n    x\n\n'
+                               '.. req:req:: R2\n    :reqid: REQ-2\n    :parents: REQ-1\n\n    y\n\n'
+                               '.. req:reqlist:: All\n\n')
+        self.write('doc2.rst', 'Doc 2\n=====\n\n.. req:reqlist:: All\n\n'
+                               '.. req:reqlist:: Filtered\n    :filter: reqid == "REQ-2"\n\n')
+        self.write('doc3.rst', 'Doc 3\n=====\n\n.. req:reqlist:: First\n    :filter: reqid == "REQ-1" or label == "X"\n\n'
+                               'The references to REQ-1: :req:ref:`REQ-1`\n')
+        self.write('doc4.rst', 'Doc 4\n=====\n\n.. req:reqlist:: Descendants\n'
+                               '    :filter: descendant_of("REQ-1")\n\n')
+        self.write('doc5.rst', 'Doc 5\n=====\n\nNothing about requirements.\n')
+        self.build()
+
+    def body(self, out, docname):
+        # the content of the page, without the navigation (not updated by Sphinx)
+        s = self.read(out, docname + '.html')
+        return s[s.index('<div class="body"'):s.index('<div class="sphinxsidebar"')]
+
+    def compare(self, docnames):
+        self.build(out='fresh', fresh=True)
+        for d in docnames:
+            assert self.body('out', d) == self.body('fresh', d), d
+
+    def edit(self, fn, old, new):
+        with open(os.path.join(self.src, fn)) as f:
+            s = f.read()
+        assert old in s
+        self.write(fn, s.replace(old, new))
+
+    def test_noop(self):
+        self.build()
+        assert req._read_docnames == set()
+        assert req._processed_docnames == set()
+
+    def test_unrelated(self):
+        # a document without requirement, list or reference is not processed
+        self.edit('doc5.rst', 'Nothing', 'Still nothing')
+        self.build()
+        assert req._read_docnames == {'doc5'}
+        assert req._processed_docnames == set()
+
+    def test_change_requirement(self):
+        # the lists including REQ-2, not the one selecting only REQ-1
+        self.edit('doc1.rst', 'R2', 'R2 changed')
+        self.build()
+        assert req._processed_docnames == {'doc1', 'doc2', 'doc4'}
+        self.compare(('doc1', 'doc2', 'doc3', 'doc4'))
+        assert 'R2 changed' in self.body('out', 'doc2')
+
+    def test_selected(self):
+        # REQ-2 is now selected by the list of doc3, which did not include it
+        self.edit('doc1.rst', ':reqid: REQ-2\n', ':reqid: REQ-2\n    :label: X\n')
+        self.build()
+        assert req._processed_docnames == {'doc1', 'doc2', 'doc3', 'doc4'}
+        self.compare(('doc1', 'doc2', 'doc3', 'doc4'))
+        assert 'R2' in self.body('out', 'doc3')
+
+    def test_add_document(self):
+        # a new requirement: the lists of all the requirements and the ones
+        # using the graph (REQ-3 is a descendant of REQ-1)
+        self.write('doc6.rst', 'Doc 6\n=====\n\n'
+                               '.. req:req:: R3\n    :reqid: REQ-3\n    :parents: REQ-2\n\n    z\n\n'
+                               'See :req:req:`REQ-1`\n')
+        self.build()
+        assert req._read_docnames == {'doc6', 'index'}
+        # (and the references to REQ-1)
+        assert req._processed_docnames == {'doc1', 'doc2', 'doc3', 'doc4', 'doc6'}
+        self.compare(('doc1', 'doc2', 'doc3', 'doc4', 'doc6'))
+        assert 'REQ-3' in self.body('out', 'doc4')
+
+    def test_reference(self):
+        # a new reference to REQ-1: the list of the references to REQ-1 (doc3)
+        self.edit('doc5.rst', 'Nothing', ':req:req:`REQ-1` and nothing')
+        self.build()
+        assert req._processed_docnames == {'doc3', 'doc5'}
+        self.compare(('doc3', 'doc5'))
+        assert 'doc5.html#REQ-1-' in self.body('out', 'doc3')
+
+    def test_write_all(self):
+        # all the documents are written (-a), the references in the lists are resolved
+        self.edit('doc1.rst', '.. req:req:: R1\n', '.. req:req:: R1 :doc:`doc5`\n')
+        self.build()
+        self.build(force_all=True)
+        assert req._processed_docnames == {'doc1', 'doc2', 'doc3', 'doc4'}
+        self.compare(('doc1', 'doc2', 'doc3', 'doc4'))
+        assert 'href="doc5.html"' in self.body('out', 'doc2')
+
+    def test_renumbered(self):
+        # the documents written again for their section numbers are processed
+        self.edit('index.rst', ':glob:', ':glob:\n    :numbered:')
+        self.edit('doc1.rst', '.. req:req:: R1\n', '.. req:req:: R1 :doc:`doc5`\n')
+        self.build()
+        self.write('doc0.rst', 'Doc 0\n=====\n')
+        self.build()
+        self.compare(('doc1', 'doc2', 'doc3', 'doc4'))
+        assert 'href="doc5.html"' in self.body('out', 'doc2')
+
+    def test_builders(self):
+        # a builder sharing the environment does not hide the changes from the others
+        self.edit('doc1.rst', 'R2', 'R2 changed')
+        self.build('latex', out='latex', doctrees='out')
+        self.build()
+        assert 'R2 changed' in self.body('out', 'doc2')
+
+    def test_domain_roles(self):
+        # the lists parsed after the documents read leave no document state in the environment
+        self.edit('doc1.rst', 'R2', 'R2 about :mod:`os`')
+        self.build()
+        self.build()
+        assert req._read_docnames == set()
+
+    def test_table_ids(self):
+        # the tables are numbered in the scope of the document: doc2 alone is processed
+        self.edit('doc2.rst', 'Doc 2\n=====\n', 'Doc 2\n=====\n\nSee :req:ref:`REQ-1`\n')
+        self.build()
+        assert req._processed_docnames == {'doc2'}
+        self.compare(('doc1', 'doc2'))
+        assert len(set(re.findall(r'id="(reqlist-[^"]*)"', self.read('out', 'doc2.html')))) == 2
+
+#_______________________________________________________________________________
+class TestCsvCache(BuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write('reqs.csv', 'reqid,title,content\nREQ-1,The `first`,x\n')
+        self.write('doc1.rst', 'Doc 1\n=====\n\n.. req:req::\n    :csv-file: reqs.csv\n\n')
+
+    def title(self):
+        return re.findall(r'<span class="title">(.*?)</span>', self.read('out', 'doc1.html'))
+
+    def test_config(self):
+        # the titles are rendered with the configuration of the build
+        self.build()
+        assert self.title() == ['The *first*']
+        self.write('conf.py', self.conf + "default_role = 'literal'\n")
+        self.build()
+        assert self.title() == ['The \u201cfirst\u201d']
+
+    def test_fresh(self):
+        # -E: a role defined by conf.py is not a configuration value
+        role = ("def setup(app):\n"
+                "    from docutils import nodes\n"
+                "    app.add_role('r', lambda name, rawtext, text, *args, **kwargs: ([nodes.%s(text, text)], []))\n")
+        self.write('reqs.csv', 'reqid,title,content\nREQ-1,The :r:`first`,x\n')
+        self.write('conf.py', self.conf + role % 'emphasis')
+        self.build()
+        assert self.title() == ['The *first*']
+        self.write('conf.py', self.conf + role % 'strong')
+        self.build(fresh=True)
+        assert self.title() == ['The **first**']
+
+#_______________________________________________________________________________
+class TestCsvExport(BuildTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write('doc1.rst', 'Doc 1\n=====\n\n.. req:req:: R1\n    :reqid: REQ-1\n\n    x\n\n'
+                               '.. req:reqlist:: All\n    :csv-file: exports/all.csv\n\n')
+
+    def test_html(self):
+        self.build()
+        assert self.read('out', 'exports/all.csv').splitlines()[1] == 'REQ-1,R1'
+
+    def test_epub(self):
+        # written before the builder packages its files
+        self.build('epub')
+        epub = [fn for fn in os.listdir(os.path.join(self.tmp.name, 'out')) if fn.endswith('.epub')]
+        with zipfile.ZipFile(os.path.join(self.tmp.name, 'out', epub[0])) as z:
+            assert 'exports/all.csv' in z.namelist()
+
+# _____________________________________________________________________________
+if __name__ == '__main__':
+    unittest.main()
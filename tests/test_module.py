@@ -1,7 +1,13 @@
 
+import io
+import os
+import contextlib
+import tempfile
 import unittest
 
 import sphinxcontrib.requirement.__main__ as main
+import sphinxcontrib.requirement.lint as lint
+from sphinxcontrib.requirement import req
 
 #_______________________________________________________________________________
 class TestReq(unittest.TestCase):
@@ -69,6 +75,166 @@ A req with already an ID
         assert mo.groups() is not None
         assert mo['options'] == '\n'.join(S.splitlines()[-2:])+'\n'
 
+#_______________________________________________________________________________
+class TestDir(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.write('a.rst', '.. req:req:: A1\n    :reqid: REQ-1001\n\n.. req:req:: A2\n    :priority: 2\n')
+        self.write('sub/b.rst', '.. req:req:: B1\n    :priority: 1\n    :label: REQ-1002\n')
+        self.write('_build/c.rst', '.. req:req:: C1\n    :priority: 1\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, fn, s):
+        path = os.path.join(self.tmp.name, fn)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(s)
+
+    def read(self, fn):
+        with open(os.path.join(self.tmp.name, fn)) as f:
+            return f.read()
+
+    def test_allocate(self):
+        files = main.find_files(self.tmp.name, exclude=['_build'])
+        assert files == ['a.rst', os.path.join('sub', 'b.rst')]
+        scanned = [main.scan(os.path.join(self.tmp.name, fn)) for fn in files]
+        assert scanned == [(['REQ-1001'], 1), (['REQ-1002'], 1)]
+        # the same document ID: REQ-1001 and REQ-1002 are already used
+        assert main.allocate(files, scanned, 'REQ-{doc}{serial:03d}', doc='1') == \
+            {'a.rst': ['REQ-1003'], os.path.join('sub', 'b.rst'): ['REQ-1004']}
+        assert main.allocate(files, scanned, 'REQ-{doc}{serial:03d}') == \
+            {'a.rst': ['REQ-0001'], os.path.join('sub', 'b.rst'): ['REQ-1003']}
+
+    def test_check(self):
+        assert main.main(['--dir', self.tmp.name, '--check', '-l', 'WARNING']) == 1
+        assert self.read('a.rst').count(':reqid:') == 1
+
+    def test_rewrite(self):
+        assert main.main(['--dir', self.tmp.name, '-j', '2', '-l', 'WARNING']) == 0
+        assert ':reqid: REQ-0001\n    :priority: 2' in self.read('a.rst')
+        assert ':reqid: REQ-1003' in self.read(os.path.join('sub', 'b.rst'))
+        assert ':reqid:' not in self.read(os.path.join('_build', 'c.rst'))
+        assert main.main(['--dir', self.tmp.name, '--check', '-l', 'WARNING']) == 0
+
+    def test_csv(self):
+        # the IDs of the CSV imports are used (the path relative to the directory)
+        self.write('data.csv', 'reqid,title\nREQ-0001,Imported\n')
+        self.write('sub/c.rst', '.. req:req::\n    :csv-file: /data.csv\n')
+        assert main.main(['--dir', self.tmp.name, '-l', 'WARNING']) == 0
+        assert ':reqid: REQ-0002\n    :priority: 2' in self.read('a.rst')
+
+    def test_newline(self):
+        # the lines added end as the other lines of the file
+        with open(os.path.join(self.tmp.name, 'a.rst'), 'w', newline='\r\n') as f:
+            f.write('.. req:req:: A1\n    :priority: 2\n\n    text\n')
+        assert main.main(['--dir', self.tmp.name, '-l', 'WARNING']) == 0
+        with open(os.path.join(self.tmp.name, 'a.rst'), newline='') as f:
+            buf = f.read()
+        assert buf == '.. req:req:: A1\r\n    :reqid: REQ-0001\r\n    :priority: 2\r\n\r\n    text\r\n'
+
+    def test_exclude(self):
+        # -x replaces the default, and is not kept for the next calls
+        assert main.main(['--dir', self.tmp.name, '-x', 'sub', '-l', 'WARNING']) == 0
+        assert ':reqid:' not in self.read(os.path.join('sub', 'b.rst'))
+        assert ':reqid:' in self.read(os.path.join('_build', 'c.rst'))
+        assert main.main(['--dir', self.tmp.name, '-l', 'WARNING']) == 0
+        assert ':reqid:' in self.read(os.path.join('sub', 'b.rst'))
+
+#_______________________________________________________________________________
+class TestLint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, fn, s):
+        with open(os.path.join(self.tmp.name, fn), 'w') as f:
+            f.write(s)
+
+    def lint(self, **kwargs):
+        linter = lint.Linter({'parents': 'children'}, **kwargs)
+        for fn in lint.find_files(self.tmp.name):
+            linter.scan_file(os.path.join(self.tmp.name, fn), fn)
+        return [(lint._format(location), message) for location, message in linter.check()]
+
+    def test_ok(self):
+        self.write('a.rst', '.. req:req:: A1\n    :reqid: REQ-1\n\n'
+                            '.. req:req:: A2\n    :reqid: REQ-2\n    :parents: REQ-1\n\n'
+                            'See :req:req:`REQ-1` and :req:ref:`the second <REQ-2>`\n')
+        assert self.lint() == []
+
+    def test_errors(self):
+        self.write('a.rst', '.. req:req:: A1\n    :reqid: REQ-1\n    :parents: REQ-2\n\n'
+                            '.. req:req:: A2\n    :reqid: REQ-2\n    :parents: REQ-1, REQ-9\n\n'
+                            'See :req:req:`REQ-8`\n')
+        self.write('b.rst', '.. req:req:: B1\n    :label: REQ-1\n    :children: REQ-7\n')
+        assert self.lint() == [
+            ('a.rst:1', 'cycle in parents: REQ-1, REQ-2'),
+            ('a.rst:5', 'parents of REQ-2: unknown requirement REQ-9'),
+            ('a.rst:9', ':req:req: unknown requirement REQ-8'),
+            ('b.rst:1', 'REQ-1 already defined at a.rst:1'),
+            ('b.rst:1', 'children of REQ-1: unknown requirement REQ-7'),
+        ]
+
+    def test_literal(self):
+        # examples are not checked
+        self.write('a.rst', 'An example::\n\n    .. req:req:: A1\n        :reqid: REQ-1\n\n'
+                            '.. code-block:: rst\n\n    :req:req:`REQ-2`\n\n'
+                            '.. req:req:: A1\n    :reqid: REQ-1\n\n'
+                            'The role ``:req:req:`REQ-3``` and :req:req:`REQ-1`\n')
+        assert self.lint() == []
+
+    def test_csv(self):
+        self.write('a.csv', 'reqid,priority,parents\nREQ-1,1,\nREQ-2,5,REQ-1\nREQ-3,10,REQ-4\n')
+        self.write('a.rst', 'Title\n\n.. req:req::\n    :csv-file: a.csv\n    :filter: priority < 10\n')
+        options = {'priority': 'directives.positive_int'}
+        assert self.lint(options=options) == []
+        self.write('a.rst', 'Title\n\n.. req:req::\n    :csv-file: a.csv\n')
+        assert self.lint(options=options) == [
+            ('a.rst:3 (a.csv, row 4)', 'parents of REQ-3: unknown requirement REQ-4')]
+
+    def test_csv_re(self):
+        # the filters are evaluated as in req.py, with the module re
+        self.write('a.csv', 'reqid,content,parents\nREQ-1,a very very long one,\nREQ-2,short,REQ-9\n')
+        self.write('a.rst', 'Title\n\n.. req:req::\n    :csv-file: a.csv\n'
+                            "    :filter: re.search(r'\\svery very\\s', content)\n")
+        assert self.lint() == []
+
+    def test_csv_root(self):
+        # a path starting with / is relative to the source directory, as in Sphinx
+        os.makedirs(os.path.join(self.tmp.name, 'sub'))
+        self.write('a.csv', 'reqid,parents\nREQ-1,\n')
+        self.write(os.path.join('sub', 'b.rst'), 'Title\n\n.. req:req::\n    :csv-file: /a.csv\n\n:req:req:`REQ-1`\n')
+        assert self.lint(root=self.tmp.name) == []
+
+    def test_filter_globals(self):
+        # the same globals as the build
+        assert lint.FILTER_GLOBALS is req.FILTER_GLOBALS
+
+    def test_exclude(self):
+        # -x replaces the default, and is not kept for the next calls
+        os.makedirs(os.path.join(self.tmp.name, '_build'))
+        os.makedirs(os.path.join(self.tmp.name, 'sub'))
+        self.write(os.path.join('_build', 'a.rst'), ':req:req:`REQ-1`\n')
+        self.write(os.path.join('sub', 'b.rst'), ':req:req:`REQ-2`\n')
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            assert lint.main([self.tmp.name, '-x', 'sub']) == 1
+        assert 'REQ-1' in out.getvalue() and 'REQ-2' not in out.getvalue()
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            assert lint.main([self.tmp.name]) == 1
+        assert 'REQ-2' in out.getvalue() and 'REQ-1' not in out.getvalue()
+
+    def test_main(self):
+        self.write('conf.py', 'req_links = dict(parents="children")\n')
+        self.write('a.rst', '.. req:req:: A1\n    :reqid: REQ-1\n    :parents: REQ-1\n')
+        assert lint.main([self.tmp.name]) == 1
+        assert lint.main([self.tmp.name, '-l', 'other:others']) == 0
+
 # _____________________________________________________________________________
 if __name__ == '__main__':
     unittest.main()
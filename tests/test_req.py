@@ -0,0 +1,370 @@
+
+import os
+import pickle
+import types
+import tempfile
+import unittest
+import tracemalloc
+
+from docutils.parsers.rst import directives
+from sphinx.config import ConfigValue
+
+from sphinxcontrib.requirement import req
+
+#_______________________________________________________________________________
+class TestFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.reqs = [
+            dict(reqid='REQ-01', title='First', priority=1),
+            dict(reqid='REQ-02', title='Second'),
+            dict(reqid='REQ-03', title='Third', priority=2),
+        ]
+        # a customized option, as defined with req_options
+        req.ReqDirective.option_spec['priority'] = directives.positive_int
+
+    def tearDown(self):
+        del req.ReqDirective.option_spec['priority']
+
+    def test_nofilter(self):
+        assert req._filter_and_sort(self.reqs) == self.reqs
+
+    def test_filter(self):
+        reqs = req._filter_and_sort(self.reqs, "title.find('i')>=0")
+        assert [r['reqid'] for r in reqs] == ['REQ-01', 'REQ-03']
+
+    def test_missing_option(self):
+        # priority is not defined on all requirements
+        reqs = req._filter_and_sort(self.reqs, "priority==1")
+        assert [r['reqid'] for r in reqs] == ['REQ-01']
+        reqs = req._filter_and_sort(self.reqs, "priority is None")
+        assert [r['reqid'] for r in reqs] == ['REQ-02']
+
+    def test_regexp(self):
+        reqs = req._filter_and_sort(self.reqs, r"re.search(r'^S', title)")
+        assert [r['reqid'] for r in reqs] == ['REQ-02']
+
+    def test_unknown_name(self):
+        with self.assertRaises(NameError):
+            req._filter_and_sort(self.reqs, "unknown==1")
+
+    def test_compiled_once(self):
+        req._filter_and_sort(self.reqs, "priority==2")
+        code = req._compiled_filters["priority==2"]
+        req._filter_and_sort(self.reqs, "priority==2")
+        assert req._compiled_filters["priority==2"] is code
+
+#_______________________________________________________________________________
+class TestSort(unittest.TestCase):
+
+    def setUp(self):
+        self.reqs = [
+            dict(reqid='REQ-01010', title='B', priority=2),
+            dict(reqid='REQ-0102', title='A'),
+            dict(reqid='REQ-0009', title='B', priority=1),
+            dict(reqid='REQ-0100', title='A', priority=1),
+        ]
+
+    def ids(self, reqs):
+        return [r['reqid'] for r in reqs]
+
+    def test_natural(self):
+        reqs = req._filter_and_sort(self.reqs, sort='reqid')
+        assert self.ids(reqs) == ['REQ-0009', 'REQ-0100', 'REQ-0102', 'REQ-01010']
+
+    def test_reverse(self):
+        reqs = req._filter_and_sort(self.reqs, sort='-reqid')
+        assert self.ids(reqs) == ['REQ-01010', 'REQ-0102', 'REQ-0100', 'REQ-0009']
+
+    def test_precedence(self):
+        # the first key has the highest precedence
+        reqs = req._filter_and_sort(self.reqs, sort='title, -reqid')
+        assert self.ids(reqs) == ['REQ-0102', 'REQ-0100', 'REQ-01010', 'REQ-0009']
+
+    def test_missing_values(self):
+        reqs = req._filter_and_sort(self.reqs, sort='priority, reqid')
+        assert self.ids(reqs) == ['REQ-0102', 'REQ-0009', 'REQ-0100', 'REQ-01010']
+
+#_______________________________________________________________________________
+class TestText(unittest.TestCase):
+
+    def test_plain(self):
+        # no markup, the text is not parsed
+        assert req._get_text(None, 'Title 1 (draft) - 10% & more\nsecond line ') == 'Title 1 (draft) - 10% & more\nsecond line'
+
+    def test_markup(self):
+        for s in ['**bold**', '`link`_', 'see ref_', '|product|', 'a :role:`x`', 'end::',
+                  '- item', '1. item', 'A. Smith', '#. item', '.. comment', 'para\n\npara', 'term\n  definition']:
+            assert not (req._rPlainText.fullmatch(s) and not req._rMarkupLine.search(s)), s
+
+    def test_new_config(self):
+        # the cache is not kept from a previous build
+        req._text_cache['**old**'] = 'old'
+        config = types.SimpleNamespace(req_profile=False, latex_elements={}, req_latex_preamble='',
+                                       req_options={}, req_links={})
+        req.config_inited(None, config)
+        assert req._text_cache == {}
+        assert req._text_writer is None
+
+#_______________________________________________________________________________
+class Config(types.SimpleNamespace):
+    # the configuration values, all of them rebuilding the environment
+
+    def filter(self, rebuild):
+        return [ConfigValue(name, value, 'env') for name, value in vars(self).items()]
+
+class TestCsvCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv = os.path.join(self.tmp.name, 'reqs.csv')
+        with open(self.csv, 'w') as f:
+            f.write('reqid,title\nREQ-01,First\n')
+        self.path = os.path.join(self.tmp.name, 'req-csv', 'x.pickle')
+        self.config = Config(req_options={}, req_links={'parents': 'children'}, default_role=None, extensions=[])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def key(self, **options):
+        # a new build: the configuration may have changed
+        req._config_hash = None
+        return req._csv_cache_key(self.config, self.csv, options, None, None)
+
+    def test_roundtrip(self):
+        reqs = [dict(reqid='REQ-01', title='First')]
+        node = req.req_node('', title='*First*', content='', text_title='First', text_content='')
+        req._save_csv_cache(self.path, self.key(), reqs, [node])
+        assert req._load_csv_cache(self.path, self.key()) == reqs
+        assert req._text_cache['*First*'] == 'First'
+
+    def test_invalidation(self):
+        req._save_csv_cache(self.path, self.key(), [], [])
+        assert req._load_csv_cache(self.path, self.key(hidden=None)) is None
+        self.config.req_options = dict(priority="directives.positive_int")
+        assert req._load_csv_cache(self.path, self.key()) is None
+        self.config.req_options = {}
+        # the rendering of the titles and contents
+        self.config.default_role = 'literal'
+        assert req._load_csv_cache(self.path, self.key()) is None
+        self.config.default_role = None
+        assert req._load_csv_cache(self.path, self.key()) is not None
+        with open(self.csv, 'a') as f:
+            f.write('REQ-02,Second\n')
+        assert req._load_csv_cache(self.path, self.key()) is None
+
+    def test_missing(self):
+        assert req._load_csv_cache(self.path, self.key()) is None
+
+    def test_converter(self):
+        # a converter set in conf.py, without req_options
+        key = self.key()
+        spec = req.ReqDirective.option_spec
+        spec['answer'] = directives.flag
+        try:
+            assert self.key() != key
+            key = self.key()
+            spec['answer'] = directives.unchanged
+            assert self.key() != key
+        finally:
+            del spec['answer']
+
+    def test_not_picklable(self):
+        with self.assertLogs(req.logger.logger, 'WARNING'):
+            req._save_csv_cache(self.path, self.key(), [dict(reqid='REQ-01', check=lambda: 0)], [])
+        assert os.listdir(os.path.dirname(self.path)) == []
+
+    def test_prune(self):
+        req._save_csv_cache(self.path, self.key(), [], [])
+        req._save_csv_cache(self.path.replace('x.', 'y.'), self.key(), [], [])
+        env = types.SimpleNamespace(doctreedir=self.tmp.name)
+        dom = types.SimpleNamespace(data={'csvcache': {'index': {'x.pickle'}}})
+        req._prune_csv_cache(env, dom)
+        assert os.listdir(os.path.dirname(self.path)) == ['x.pickle']
+
+#_______________________________________________________________________________
+class TestGraph(unittest.TestCase):
+
+    def setUp(self):
+        reqs = [dict(reqid=x) for x in ['R-1', 'R-2', 'R-3', 'R-4', 'R-5']]
+        links = {
+            'R-2': {'parents': ['R-1']},
+            'R-3': {'parents': ['top']},
+            'R-4': {'parents': ['R-3', 'R-2']},
+            'R-5': {'parents': ['R-9']},
+        }
+        labels = {'top': 'R-1'}
+        self.graph = req.ReqGraph(reqs, links, labels, {'parents': 'children', 'children': 'parents'},
+            'parents', 'children')
+
+    def test_linked(self):
+        assert self.graph.linked('R-1', 'children') == ['R-2', 'R-3']
+        assert self.graph.linked('R-4', 'parents') == ['R-2', 'R-3']
+        assert self.graph.linked('top', 'children') == ['R-2', 'R-3']
+        # link to an undefined requirement
+        assert self.graph.linked('R-5', 'parents') == ['R-9']
+        assert self.graph.get('R-9') is None
+
+    def test_descendants(self):
+        assert self.graph.descendants('R-1', 'children') == ['R-2', 'R-3', 'R-4']
+        assert self.graph.descendants('R-4', 'parents') == ['R-2', 'R-3', 'R-1']
+        assert self.graph.descendants('R-4', 'children') == []
+
+    def test_cycle(self):
+        graph = req.ReqGraph([dict(reqid=x) for x in 'ABCD'],
+            {'A': {'parents': ['B']}, 'B': {'parents': ['A']}, 'C': {'parents': ['A']}, 'D': {'parents': ['D']}},
+            {}, {'parents': 'children', 'children': 'parents'}, 'parents', 'children')
+        assert graph.descendants('A', 'parents') == ['B']
+        assert [x for x in 'ABCD' if graph.in_cycle(x)] == ['A', 'B', 'D']
+        assert graph.depth('C') is None
+
+    def test_depth(self):
+        assert [self.graph.depth(x) for x in ['R-1', 'R-2', 'R-3', 'R-4', 'R-5']] == [0, 1, 1, 2, None]
+        assert self.graph.ancestors('R-4') == ['R-2', 'R-3', 'R-1']
+
+    def test_orphans(self):
+        assert self.graph.orphans('parents') == ['R-1']
+        assert self.graph.orphans('children') == ['R-4', 'R-5']
+
+    def filter(self, filter):
+        return [r['reqid'] for r in req._filter_and_sort(self.graph.reqs, filter, graph=self.graph)]
+
+    def test_filter(self):
+        assert self.filter("reqid in graph.descendants('R-2', 'children')") == ['R-4']
+        assert self.filter("descendant_of('top')") == ['R-2', 'R-3', 'R-4']
+        assert self.filter("ancestor_of('R-4')") == ['R-1', 'R-2', 'R-3']
+        assert self.filter("descendant_of('R-1') and uncovered()") == ['R-4']
+        assert self.filter("uncovered('parents')") == ['R-1']
+        assert self.filter("depth == 1") == ['R-2', 'R-3']
+        assert self.filter("not cycle") == ['R-1', 'R-2', 'R-3', 'R-4', 'R-5']
+        assert self.filter("descendant_of('UNKNOWN')") == []
+        assert req._uses_graph("depth > 2") and not req._uses_graph("priority > 2")
+
+#_______________________________________________________________________________
+class TestRecord(unittest.TestCase):
+
+    def setUp(self):
+        node = req.req_node('', reqid='R-1', title='First', priority=2, parents=['R-0'],
+                            _parents=':req:links:`parents::R-1`', ids=['req-R-1'])
+        node += req.nodes.target('', '', ids=['req-R-1'])
+        self.record = req.ReqRecord(node, 'doc', ['parents', 'children'])
+
+    def test_fields(self):
+        r = self.record
+        assert (r._reqid, r._label, r._docname, r._anchor) == ('R-1', None, 'doc', 'req-R-1')
+        assert r['title'] == 'First' and r.get('priority') == 2 and r.get('comment', '') == ''
+        assert 'ids' not in r and 'label' not in r
+        assert r['_parents'] == ':req:links:`parents::R-1`' and '_children' in r
+        assert '{reqid}: {title}'.format(**r) == 'R-1: First'
+        with self.assertRaises(KeyError):
+            r['_other']
+
+    def test_pickle(self):
+        r = pickle.loads(pickle.dumps(self.record))
+        assert r._fields == {'reqid': 'R-1', 'title': 'First', 'priority': 2, 'parents': ['R-0']}
+        assert r['_children'] == ':req:links:`children::R-1`'
+
+    def test_filter(self):
+        assert req._filter_and_sort([self.record], 'priority == 2 and title.startswith("F")') == [self.record]
+        assert req._filter_and_sort([self.record], 'label') == []
+
+#_______________________________________________________________________________
+class TestExport(unittest.TestCase):
+
+    def test_fields(self):
+        config = types.SimpleNamespace(
+            req_options=dict(priority="directives.positive_int", title="directives.unchanged"),
+            req_links={'parents': 'children'})
+        assert req._export_fields(config) == ['reqid', 'label', 'title', 'content', 'comment',
+            'text_title', 'text_content', 'priority', 'parents', 'children', 'docname']
+
+#_______________________________________________________________________________
+class TestProfile(unittest.TestCase):
+
+    def tearDown(self):
+        req._profile = None
+
+    def test_disabled(self):
+        req._profile = None
+        assert req._get_text(None, 'Plain text') == 'Plain text'
+        with req._timed('query'):
+            pass
+        assert req._profile is None
+
+    def test_enabled(self):
+        req._profile = {}
+        req._get_text(None, 'Plain text')
+        req._get_text(None, 'Another one')
+        with req._timed('query'):
+            pass
+        assert req._profile['text'][0] == 2
+        assert req._profile['query'][0] == 1 and req._profile['query'][1] >= 0
+        assert req._profile['query'][2] == 0
+
+    def test_peak(self):
+        # the peak of each phase, including the phases it calls
+        req._profile = {}
+        tracemalloc.start()
+        try:
+            with req._timed('fill'):
+                with req._timed('query'):
+                    x = bytearray(1 << 20)
+                del x
+                with req._timed('render'):
+                    pass
+        finally:
+            tracemalloc.stop()
+        assert req._profile['query'][2] >= 1 << 20
+        assert req._profile['fill'][2] >= req._profile['query'][2]
+        assert req._profile['render'][2] < 1 << 20
+
+#_______________________________________________________________________________
+class TestSerial(unittest.TestCase):
+
+    def test_overflow(self):
+        # more requirements than reserved: unique serials, whatever the order
+        dom = req.ReqDomain.__new__(req.ReqDomain)
+        dom.data = dict(serials={'a': range(1, 3), 'b': range(3, 4)}, serial=4, serial_step=2,
+                        docindex={'a': 0, 'b': 1}, overflow=set())
+        serials = [dom.new_serial(d, n) for d in ('b', 'a') for n in range(1, 6)]
+        assert serials == [3, 5, 7, 9, 11, 1, 2, 4, 6, 8]
+        assert dom.data['overflow'] == {'a', 'b'}
+
+#_______________________________________________________________________________
+class TestLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'ids.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_first(self):
+        # the same as without ledger
+        docindex, serials, serial = req._update_ledger(self.path, ['a', 'b', 'c'], {'a': 2, 'b': 0, 'c': 1})
+        assert docindex == {'a': 0, 'b': 1, 'c': 2}
+        assert serials == {'a': [1, 2], 'c': [3]}
+        assert serial == 4
+
+    def test_stable(self):
+        req._update_ledger(self.path, ['b', 'c'], {'b': 2, 'c': 1})
+        mtime = os.stat(self.path).st_mtime_ns
+        # nothing new: the ledger is not written again
+        assert req._update_ledger(self.path, ['b', 'c'], {'b': 1, 'c': 1})[1] == {'b': [1, 2], 'c': [3]}
+        assert os.stat(self.path).st_mtime_ns == mtime
+        # a new document and a new requirement do not change the other documents
+        docindex, serials, serial = req._update_ledger(self.path, ['a', 'b', 'c'], {'a': 1, 'b': 2, 'c': 2})
+        assert docindex == {'a': 2, 'b': 0, 'c': 1}
+        assert serials == {'a': [4], 'b': [1, 2], 'c': [3, 5]}
+        assert serial == 6
+
+    def test_invalid(self):
+        with open(self.path, 'w') as f:
+            f.write('{')
+        with self.assertRaises(req.ConfigError):
+            req._update_ledger(self.path, ['a'], {'a': 1})
+
+# _____________________________________________________________________________
+if __name__ == '__main__':
+    unittest.main()